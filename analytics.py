@@ -1,4 +1,5 @@
 from libs import *
+from db_handler import ensure_data_versions
 
 class Analytics:
 
@@ -37,22 +38,23 @@ class Analytics:
         self.logger.info("Creating views...")
         schema = self.schema_name
         views = {
+            # per-customer totals come from the trigger-maintained summary, a primary-key join
             'vw_customer_overview': f"""
                 CREATE OR REPLACE VIEW {schema}.vw_customer_overview AS
                 SELECT c."customerId", c."profileId", c."name", c."number",
                     c."number2", c.gender, c."dateOfBirth", c."accountType",
                     c.branch,
-                    COUNT(co."customerId") AS "totalComplaints",
-                    MIN(co."logDate") AS "firstComplaintDate",
-                    MAX(co."logDate") AS "lastComplaintDate"
+                    COALESCE(s."totalComplaints", 0) AS "totalComplaints",
+                    s."firstComplaintDate",
+                    s."lastComplaintDate",
+                    COALESCE(s."openComplaints", 0) AS "openComplaints"
                 FROM {schema}.customers c
-                LEFT JOIN {schema}.complaints co
-                    ON c."customerId" = co."customerId"
-                GROUP BY c."customerId", c."profileId", c."name",
-                        c."number", c."number2", c.gender,
-                        c."dateOfBirth", c."accountType", c.branch;
+                LEFT JOIN {schema}.customer_summary s
+                    ON c."customerId" = s."customerId";
             """,
 
+            # the heavy aggregates read from their materialized equivalents
+
             'vw_complaint_summary': f"""
                 CREATE OR REPLACE VIEW {schema}.vw_complaint_summary AS
                 SELECT co."customerId", c."name", c."number", co."profileId",
@@ -71,17 +73,7 @@ class Analytics:
 
             'vw_regional_stats': f"""
                 CREATE OR REPLACE VIEW {schema}.vw_regional_stats AS
-                SELECT region,
-                    COUNT(*) as "totalComplaints",
-                    COUNT(DISTINCT "customerId") as "uniqueCustomers",
-                    AVG("turnaroundTime") as "avgTurnaroundTime",
-                    SUM(CASE WHEN status = 'Resolved' THEN 1 ELSE 0 END) as "resolvedCount",
-                    ROUND(
-                        (SUM(CASE WHEN status = 'Resolved' THEN 1 ELSE 0 END) * 100.0 / COUNT(*)), 2
-                    ) as "resolutionRate"
-                FROM {schema}.complaints
-                WHERE region IS NOT NULL AND region != 'Unknown'
-                GROUP BY region
+                SELECT * FROM {schema}.mv_regional_stats
                 ORDER BY "totalComplaints" DESC;
             """,
 
@@ -100,16 +92,10 @@ class Analytics:
 
             'vw_monthly_trends': f"""
                 CREATE OR REPLACE VIEW {schema}.vw_monthly_trends AS
-                SELECT TO_CHAR(DATE_TRUNC('month', co."logDate"), 'Month YYYY') as "month",
-                    COUNT(*) as "totalComplaints",
-                    COUNT(DISTINCT co."customerId") as "uniqueCustomers",
-                    AVG(co."turnaroundTime") as "avgTurnaroundTime",
-                    MODE() WITHIN GROUP (ORDER BY co."natureOfComplaint") as "topComplaintType",
-                    MODE() WITHIN GROUP (ORDER BY co."region") as "topRegion"
-                FROM {schema}.complaints co
-                WHERE co."logDate" IS NOT NULL
-                GROUP BY DATE_TRUNC('month', co."logDate")
-                ORDER BY DATE_TRUNC('month', co."logDate") DESC;
+                SELECT "month", "totalComplaints", "uniqueCustomers", "avgTurnaroundTime",
+                    "topComplaintType", "topRegion"
+                FROM {schema}.mv_monthly_trends
+                ORDER BY "monthStart" DESC;
             """
         }
         self.logger.info("Views created successfully.")
@@ -124,13 +110,11 @@ class Analytics:
        
         self.logger.info("All views created successfully.")
 
-    # Create materialized views for the tables
-    def create_materialized_views(self):
-        self.logger.info("Creating materialized views...")
+    # Materialized views: name -> (query, unique key for concurrent refreshes, tables it reads)
+    def _materialized_views(self):
         schema = self.schema_name
-        mats = {
-            'mv_monthly_complaint_summary': f"""
-                CREATE MATERIALIZED VIEW {schema}.mv_monthly_complaint_summary AS
+        return {
+            'mv_monthly_complaint_summary': (f"""
                 SELECT TO_CHAR(DATE_TRUNC('month', co."logDate"), 'Month YYYY') as "month",
                        COUNT(*) as "totalComplaints",
                        COUNT(DISTINCT co."customerId") as "uniqueCustomers",
@@ -138,15 +122,103 @@ class Analytics:
                 FROM {schema}.complaints co
                 WHERE co."logDate" IS NOT NULL
                 GROUP BY DATE_TRUNC('month', co."logDate")
-                ORDER BY DATE_TRUNC('month', co."logDate") DESC;
-            """
+                ORDER BY DATE_TRUNC('month', co."logDate") DESC
+            """, ['month'], ['complaints']),
+
+            'mv_regional_stats': (f"""
+                SELECT region,
+                    COUNT(*) as "totalComplaints",
+                    COUNT(DISTINCT "customerId") as "uniqueCustomers",
+                    AVG("turnaroundTime") as "avgTurnaroundTime",
+                    SUM(CASE WHEN status = 'Resolved' THEN 1 ELSE 0 END) as "resolvedCount",
+                    ROUND(
+                        (SUM(CASE WHEN status = 'Resolved' THEN 1 ELSE 0 END) * 100.0 / COUNT(*)), 2
+                    ) as "resolutionRate"
+                FROM {schema}.complaints
+                WHERE region IS NOT NULL AND region != 'Unknown'
+                GROUP BY region
+            """, ['region'], ['complaints']),
+
+            'mv_monthly_trends': (f"""
+                SELECT TO_CHAR(DATE_TRUNC('month', co."logDate"), 'Month YYYY') as "month",
+                    COUNT(*) as "totalComplaints",
+                    COUNT(DISTINCT co."customerId") as "uniqueCustomers",
+                    AVG(co."turnaroundTime") as "avgTurnaroundTime",
+                    MODE() WITHIN GROUP (ORDER BY co."natureOfComplaint") as "topComplaintType",
+                    MODE() WITHIN GROUP (ORDER BY co."region") as "topRegion",
+                    DATE_TRUNC('month', co."logDate") as "monthStart"
+                FROM {schema}.complaints co
+                WHERE co."logDate" IS NOT NULL
+                GROUP BY DATE_TRUNC('month', co."logDate")
+            """, ['monthStart'], ['complaints']),
         }
-        with self.engine.begin() as conn:
-            for name, sql in mats.items():
-                try:
-                    conn.execute(text(sql))
+
+    # Sum of the data versions of the given tables (bumped by every pipeline write that changed them)
+    def _data_version(self, conn, tables):
+        ensure_data_versions(conn, self.schema_name)
+        return conn.execute(text(f"""
+            SELECT COALESCE(SUM("version"), 0) FROM {self.schema_name}.etl_data_versions WHERE "table" = ANY(:tables)
+        """), {"tables": list(tables)}).scalar()
+
+    # When each materialized view was last refreshed, and at which data version
+    def _ensure_refresh_log(self, conn):
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {self.schema_name}.etl_view_refreshes (
+                "view" VARCHAR(63) PRIMARY KEY,
+                "version" BIGINT NOT NULL,
+                "refreshedAt" TIMESTAMPTZ NOT NULL
+            );
+        """))
+
+    def _record_refresh(self, conn, name, version):
+        self._ensure_refresh_log(conn)
+        conn.execute(text(f"""
+            INSERT INTO {self.schema_name}.etl_view_refreshes ("view", "version", "refreshedAt")
+            VALUES (:view, :version, now())
+            ON CONFLICT ("view") DO UPDATE SET "version" = EXCLUDED."version", "refreshedAt" = EXCLUDED."refreshedAt";
+        """), {"view": name, "version": version})
+
+    # Create materialized views for the tables, with the unique indexes concurrent refreshes need
+    def create_materialized_views(self):
+        self.logger.info("Creating materialized views...")
+        schema = self.schema_name
+        for name, (query, key, tables) in self._materialized_views().items():
+            with self.engine.begin() as conn:
+                exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": f"{schema}.{name}"}).scalar()
+                columns = ", ".join(f'"{col}"' for col in key)
+                conn.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {schema}.{name} AS {query};"))
+                conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{name} ON {schema}.{name} ({columns});"))
+                if not exists:
+                    # populated on creation, so it is current as of this data version
+                    self._record_refresh(conn, name, self._data_version(conn, tables))
                     self.logger.info(f"Created materialized view: {name}")
-                except Exception as e:
-                    self.logger.error(f"Error creating materialized view {name}: {str(e)}")
-        
+
         self.logger.info("Materialized views created successfully.")
+
+    # Refresh materialized views whose tables changed since their last refresh, without blocking readers
+    def refresh_materialized_views(self, force=False):
+        schema = self.schema_name
+        refreshed = []
+        for name, (query, key, tables) in self._materialized_views().items():
+            start = time.perf_counter()
+            with self.engine.begin() as conn:
+                version = self._data_version(conn, tables)
+                self._ensure_refresh_log(conn)
+                last = conn.execute(text(f"""
+                    SELECT "version" FROM {schema}.etl_view_refreshes WHERE "view" = :view
+                """), {"view": name}).scalar()
+                if not force and last == version:
+                    self.logger.info(f"{name} is up to date (data version {version}), skipping refresh")
+                    continue
+
+                # CONCURRENTLY diffs against the unique index and never locks out readers, but needs a populated view
+                populated = conn.execute(text("""
+                    SELECT ispopulated FROM pg_matviews WHERE schemaname = :schema AND matviewname = :name
+                """), {"schema": schema, "name": name}).scalar()
+                conn.execute(text(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if populated else ''}{schema}.{name};"))
+                self._record_refresh(conn, name, version)
+            refreshed.append(name)
+            self.logger.info(f"Refreshed {name} in {time.perf_counter() - start:.2f}s")
+
+        self.logger.info(f"Materialized views refreshed: {len(refreshed)} of {len(self._materialized_views())}")
+        return refreshed
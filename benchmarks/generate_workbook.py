@@ -0,0 +1,200 @@
+import os
+import sys
+import shutil
+import zipfile
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+# Synthetic customer-support workbooks shaped like the real CS2025 file: one sheet per month plus
+# "Unresolved", with the messy values DataCleaner has to deal with.
+#
+#   python benchmarks/generate_workbook.py --complaints 100000 --out benchmarks/data/cs_100000.xlsx
+
+FIRST_NAMES = ["Kwame", "Ama", "Kofi", "Akosua", "Yaw", "Abena", "Kwesi", "Efua", "Kojo", "Adwoa",
+               "Emmanuel", "Grace", "Samuel", "Mercy", "Daniel", "Esther", "Isaac", "Comfort"]
+LAST_NAMES = ["Mensah", "Owusu", "Boateng", "Asante", "Osei", "Agyeman", "Appiah", "Addo",
+              "Ofori", "Darko", "Amoah", "Quaye", "Tetteh", "Nkrumah", "Badu", "Frimpong"]
+REGIONS = [
+    "Ashanti Region", "Greater Accra Region", "Northern Region", "Volta Region",
+    "Central Region", "Western Region", "Upper West Region", "Upper East Region",
+    "Oti Region", "Savannah Region", "Bono East Region", "Western North Region",
+    "Brong Ahafo Region", "North East Region", "Ahafo Region", "Eastern Region"
+]
+REGION_TYPOS = ["Ashanti", "greater accra", "Greater Acra Region", "Nothern Region", "Volta Reg",
+                "Central", "Westen Region", "Upper west", "Eastern Rgion", "Accra", "Bono East"]
+BRANCHES = ["Accra Main", "Kumasi Adum", "Tamale", "Ho", "Cape Coast", "Takoradi", "Tema", "Sunyani"]
+ACCOUNT_TYPES = ["Savings", "Current", "Fixed Deposit", "Student", "Business"]
+SOURCES = ["Call Center", "Walk-In", "Email", "Social Media", "Website", "WhatsApp"]
+NATURES = ["Card Issue", "Failed Transaction", "Account Access", "Loan Enquiry", "Fraud Report",
+           "Mobile Banking", "Statement Request", "Reversal Request"]
+SUBJECTS = ["ATM did not dispense cash", "Card blocked", "Wrong debit", "Cannot log in",
+            "Delayed transfer", "Unauthorised charge", "Loan balance", "Statement not received"]
+STATUSES = ["Resolved", "resolved ", "Pending", "Escalated", "Closed", "in progress"]
+REPS = ["Akua Sarpong", "Nana Yeboah", "Kobby Annan", "Esi Bonsu", "Fiifi Eshun"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+HEADERS = ["Name", "Number", "Gender", "DOB", "Account Type", "Branch", "Location", "Region", "Log Date",
+           "Complaint Source", "Nature Of Complaint", "Subject", "Details Of Complaint", "Comment",
+           "Updates", "Status", "TAT", "Resolution Date", "Reason For Reversal Request", "Assign",
+           "Name Of CC Rep"]
+
+
+# Nine-digit Ghanaian subscriber numbers
+def subscriber_numbers(rng, count):
+    prefixes = rng.choice(np.array([24, 54, 55, 20, 50, 26, 27, 57, 59]), count)
+    return prefixes * 10_000_000 + rng.integers(0, 10_000_000, count)
+
+
+# Render subscriber numbers in the mix of formats found in the source sheets
+def messy_phones(rng, subscribers):
+    digits = pd.Series(subscribers).astype(str)
+    formats = rng.choice(8, len(subscribers), p=[0.3, 0.15, 0.15, 0.15, 0.1, 0.05, 0.05, 0.05])
+    phones = np.select(
+        [formats == 0, formats == 1, formats == 2, formats == 3, formats == 4, formats == 5, formats == 6],
+        ["0" + digits,
+         "+233 " + digits.str[:2] + " " + digits.str[2:5] + " " + digits.str[5:],
+         "233" + digits,
+         digits,
+         " 0" + digits.str[:2] + "-" + digits.str[2:5] + "-" + digits.str[5:] + " ",
+         digits.str[:5],
+         "N/A"],
+        default="",
+    ).astype(object)
+    # numbers typed into numeric cells come back from Excel as ints
+    numeric = formats == 3
+    phones[numeric] = subscribers[numeric]
+    phones[phones == ""] = None
+    return phones
+
+
+# Names with inconsistent case, stray spaces and placeholders
+def messy_names(rng, count):
+    names = pd.Series(rng.choice(FIRST_NAMES, count)) + " " + pd.Series(rng.choice(LAST_NAMES, count))
+    noise = rng.random(count)
+    names = names.where(noise > 0.1, names.str.upper())
+    names = names.where((noise < 0.1) | (noise > 0.2), "  " + names.str.lower() + " ")
+    names = names.where((noise < 0.2) | (noise > 0.23), rng.choice(["nan", "None", "", "NULL"], count))
+    return names.to_numpy(dtype=object)
+
+
+# Customers, complaints and the matching public.client rows for one workbook
+def generate_frames(complaints, seed=0, year=2025):
+    rng = np.random.default_rng(seed)
+    customers = max(complaints // 3, 1)
+
+    subscribers = subscriber_numbers(rng, customers)
+    customer = pd.DataFrame({
+        "Name": messy_names(rng, customers),
+        "Gender": rng.choice(["Male", "Female", "male", "F", None], customers),
+        "DOB": pd.to_datetime("1950-01-01") + pd.to_timedelta(rng.integers(0, 20000, customers), unit="D"),
+        "Account Type": rng.choice(ACCOUNT_TYPES, customers),
+        "Branch": rng.choice(BRANCHES, customers),
+    })
+
+    # complaints pick customers with a long tail of repeat complainers
+    owner = np.minimum(rng.zipf(1.5, complaints) - 1, customers - 1)
+    owner = (owner + rng.integers(0, customers, complaints)) % customers
+    df = customer.iloc[owner].reset_index(drop=True)
+    df.insert(1, "Number", messy_phones(rng, subscribers[owner]))
+
+    region = rng.choice(REGIONS, complaints).astype(object)
+    typo = rng.random(complaints) < 0.15
+    region[typo] = rng.choice(REGION_TYPOS, typo.sum())
+    log_date = pd.to_datetime(f"{year}-01-01") + pd.to_timedelta(rng.integers(0, 365, complaints), unit="D")
+    tat = rng.integers(0, 30, complaints).astype(float)
+    resolution = log_date + pd.to_timedelta(tat, unit="D")
+
+    # swapped dates with a negative TAT, and TATs left blank
+    swapped = rng.random(complaints) < 0.03
+    log_date, resolution = np.where(swapped, resolution, log_date), np.where(swapped, log_date, resolution)
+    tat[swapped] = -tat[swapped]
+    tat[rng.random(complaints) < 0.05] = np.nan
+
+    df["Location"] = rng.choice(BRANCHES, complaints)
+    df["Region"] = region
+    df["Log Date"] = log_date
+    df["Complaint Source"] = rng.choice(SOURCES, complaints)
+    df["Nature Of Complaint"] = rng.choice(NATURES, complaints)
+    df["Subject"] = rng.choice(SUBJECTS, complaints)
+    df["Details Of Complaint"] = df["Subject"] + " - ref " + pd.Series(rng.integers(100000, 999999, complaints)).astype(str)
+    df["Comment"] = rng.choice(["Customer called back", "Awaiting feedback", None, None], complaints)
+    df["Updates"] = rng.choice(["Forwarded to ops", "Refund processed", None], complaints)
+    df["Status"] = rng.choice(STATUSES, complaints)
+    df["TAT"] = tat
+    df["Resolution Date"] = resolution
+    df["Reason For Reversal Request"] = np.where(df["Nature Of Complaint"] == "Reversal Request", "Wrong beneficiary", None)
+    df["Assign"] = rng.choice(REPS, complaints)
+    df["Name Of CC Rep"] = rng.choice(REPS, complaints)
+    df = df[HEADERS]
+
+    # about 60% of customers are known to public.client, some with a second phone
+    known = rng.random(customers) < 0.6
+    second = rng.random(customers) < 0.3
+    client = pd.DataFrame({
+        "profileId": pd.Series(np.arange(customers)).map(lambda i: f"P{i:09d}")[known].to_numpy(),
+        "phoneNumber": ("0" + pd.Series(subscribers).astype(str))[known].to_numpy(),
+        "phoneNumber2": np.where(second, "0" + pd.Series(subscriber_numbers(rng, customers)).astype(str), None)[known],
+    })
+    return df, client
+
+
+# Write complaints to a workbook, one sheet per log month and an "Unresolved" sheet
+def write_workbook(df, path, unresolved_share=0.02):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    month = pd.DatetimeIndex(df["Log Date"]).month
+    unresolved = np.random.default_rng(1).random(len(df)) < unresolved_share
+
+    # openpyxl wants python values: datetimes, ints, floats, str and None for blanks
+    values = pd.DataFrame({col: df[col].dt.to_pydatetime() if pd.api.types.is_datetime64_any_dtype(df[col])
+                           else df[col].astype(object) for col in df.columns})
+    values = values.where(df.notna(), None)
+
+    book = Workbook(write_only=True)
+    sheets = [(name, (month == i + 1) & ~unresolved) for i, name in enumerate(MONTHS)] + [("Unresolved", unresolved)]
+    for name, mask in sheets:
+        sheet = book.create_sheet(name)
+        sheet.append(HEADERS)
+        for row in values[mask].to_numpy().tolist():
+            sheet.append(row)
+    book.save(path)
+    add_dimensions(path, [int(mask.sum()) + 1 for _, mask in sheets])
+
+
+# openpyxl's write-only mode leaves out <dimension>, which Excel always writes; without it readers
+# scan every sheet just to open the workbook, so add it to keep load timings realistic
+def add_dimensions(path, sheet_rows):
+    last_column = get_column_letter(len(HEADERS))
+    dimensions = {f"xl/worksheets/sheet{i + 1}.xml": f'<dimension ref="A1:{last_column}{rows}"/>'.encode()
+                  for i, rows in enumerate(sheet_rows)}
+    tmp_path = f"{path}.tmp"
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            if item.filename not in dimensions:
+                dst.writestr(item, src.read(item))
+                continue
+            with src.open(item) as fin, dst.open(item.filename, "w", force_zip64=True) as fout:
+                head = fin.read(64 * 1024)
+                fout.write(head.replace(b"</sheetPr>", b"</sheetPr>" + dimensions[item.filename], 1))
+                shutil.copyfileobj(fin, fout)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic customer-support workbook")
+    parser.add_argument("--complaints", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    out = args.out or os.path.join(os.path.dirname(__file__), "data", f"cs_{args.complaints}.xlsx")
+    start = datetime.now()
+    df, client = generate_frames(args.complaints, seed=args.seed)
+    write_workbook(df, out)
+    print(f"Wrote {len(df)} complaints ({len(client)} client profiles) to {out} in {(datetime.now() - start).total_seconds():.1f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+from libs import *
+import hashlib
+import json
+
+
+class FuzzyCanonicalizer:
+
+    # Initialize with the canonical values for one column
+    def __init__(self, column, canonical_values, logger, threshold=80, default="Unknown", cache=None):
+        self.column = column
+        self.canonical_values = list(canonical_values)
+        self.threshold = threshold
+        self.default = default
+        self.logger = logger
+        self.cache = cache
+        self.fingerprint = hashlib.sha1(json.dumps([self.canonical_values, threshold, default]).encode()).hexdigest()
+
+    # Map every value in a Series to its closest canonical value
+    def canonicalize(self, values: pd.Series):
+        codes, uniques = pd.factorize(values)
+        aliases = [str(value) for value in uniques]
+
+        # only score spellings we haven't resolved before
+        known = self.cache.get(self.column, self.fingerprint) if self.cache is not None else {}
+        unseen = [alias for alias in aliases if alias not in known]
+        if unseen:
+            scores = process.cdist(unseen, self.canonical_values, scorer=fuzz.token_set_ratio,
+                                   processor=None, dtype=np.float64, workers=-1)
+            best = scores.argmax(axis=1)
+            matched = scores[np.arange(len(unseen)), best] >= self.threshold
+            known.update({
+                alias: self.canonical_values[index] if ok else None
+                for alias, index, ok in zip(unseen, best, matched)
+            })
+            if self.cache is not None:
+                self.cache.put(self.column, self.fingerprint, known)
+
+        self.logger.info(f"Canonicalized {self.column}: {len(aliases)} distinct values, {len(unseen)} newly scored")
+
+        # unmatched spellings fall back to the default (or stay as-is without one), missing values (code -1) to the default
+        missing = self.default if self.default is not None else np.nan
+        resolved = []
+        for alias, original in zip(aliases, uniques):
+            canonical = known[alias]
+            if canonical is None:
+                canonical = original if self.default is None else self.default
+            resolved.append(canonical)
+        resolved = np.array(resolved + [missing], dtype=object)
+        return pd.Series(resolved[codes], index=values.index, dtype=object)
+
+
+class AliasCache:
+
+    # JSON file of alias -> canonical mappings, one section per column
+    def __init__(self, path, logger):
+        self.path = path
+        self.logger = logger
+        self.sections = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.sections = json.load(f)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Ignoring unreadable alias cache {path}: {e}")
+
+    # Aliases for a column, discarded when its canonical list or threshold changed
+    def get(self, column, fingerprint):
+        section = self.sections.get(column, {})
+        if section.get('fingerprint') != fingerprint:
+            return {}
+        return dict(section.get('aliases', {}))
+
+    def put(self, column, fingerprint, aliases):
+        self.sections[column] = {'fingerprint': fingerprint, 'aliases': aliases}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.sections, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
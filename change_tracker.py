@@ -0,0 +1,94 @@
+from libs import *
+from db_handler import read_sql_chunks
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class ChangeTracker:
+
+    # Row hashes of the last load, kept in a local manifest and in the complaints table
+    def __init__(self, engine, schema_name, manifest_file, logger):
+        self.engine = engine
+        self.schema_name = schema_name
+        self.manifest_file = manifest_file
+        self.logger = logger
+        self.enabled = pa is not None
+        if not self.enabled:
+            self.logger.warning("pyarrow is not installed, row manifest disabled")
+
+    # complaintKey -> rowHash of the last load: the manifest, or the complaints table when there is none
+    def load_previous(self):
+        if self.enabled and os.path.exists(self.manifest_file):
+            manifest = pd.read_parquet(self.manifest_file)
+            self.logger.info(f"Loaded row manifest {self.manifest_file}: {len(manifest)} rows")
+        elif self._table_has_hashes():
+            manifest = self._read_table_hashes()
+            self.logger.info(f"No row manifest, read {len(manifest)} row hashes from {self.schema_name}.complaints")
+        else:
+            return None
+        return pd.Series(manifest['rowHash'].values, index=manifest['complaintKey'].values)
+
+    def _table_has_hashes(self):
+        with self.engine.connect() as conn:
+            columns = conn.execute(text("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = :schema AND table_name = 'complaints'
+            """), {"schema": self.schema_name}).scalars().all()
+        return 'complaintKey' in columns and 'rowHash' in columns
+
+    def _read_table_hashes(self):
+        chunks = list(read_sql_chunks(self.engine, 'complaints', self.logger, schema=self.schema_name,
+                                      columns=['complaintKey', 'rowHash']))
+        if not chunks:
+            return pd.DataFrame({'complaintKey': pd.Series(dtype='int64'), 'rowHash': pd.Series(dtype='int64')})
+        # rows loaded before hashes were stored have none, and count as changed
+        return pd.concat(chunks, ignore_index=True).dropna().astype('int64')
+
+    # Keep only new and changed complaints (and their customers), and list the complaints deleted since the last load.
+    # With reload_fraction, months where at least that share of complaints changed are kept whole and returned,
+    # so they can be reloaded as a partition swap instead of row by row
+    def changed_rows(self, customers_df: pd.DataFrame, complaints_df: pd.DataFrame, reload_fraction=None):
+        previous = self.load_previous()
+        if previous is None:
+            self.logger.info(f"No earlier row hashes, treating all {len(complaints_df)} complaints as new")
+            return customers_df, complaints_df, [], []
+
+        current = pd.MultiIndex.from_arrays([complaints_df['complaintKey'], complaints_df['rowHash']])
+        known = complaints_df['complaintKey'].isin(previous.index).values
+        unchanged = current.isin(pd.MultiIndex.from_arrays([previous.index, previous.values]))
+        deleted = previous.index[~previous.index.isin(complaints_df['complaintKey'])]
+        self.logger.info(f"Row changes: {(~known).sum()} new, {(known & ~unchanged).sum()} changed, "
+                         f"{unchanged.sum()} unchanged, {len(deleted)} deleted")
+
+        keep = ~unchanged
+        reload_months = []
+        if reload_fraction is not None and 'logDate' in complaints_df.columns:
+            months = pd.to_datetime(complaints_df['logDate'], errors='coerce').dt.to_period('M')
+            share = pd.Series(keep, index=complaints_df.index).groupby(months.values).mean()
+            reload_months = share.index[share >= reload_fraction].tolist()
+            if reload_months:
+                keep |= months.isin(reload_months).values
+                self.logger.info(f"Reloading {len(reload_months)} months whole: {', '.join(str(month) for month in reload_months)}")
+
+        complaints_df = complaints_df[keep]
+        customers_df = customers_df[customers_df['number'].isin(complaints_df['number'].dropna())]
+        return customers_df, complaints_df, deleted.tolist(), reload_months
+
+    # Record the row hashes of the load that just completed
+    def save(self, complaints_df: pd.DataFrame):
+        if not self.enabled:
+            return
+        manifest = complaints_df[['complaintKey', 'rowHash']].drop_duplicates(subset=['complaintKey'], keep='last')
+        os.makedirs(os.path.dirname(self.manifest_file) or ".", exist_ok=True)
+        tmp_path = f"{self.manifest_file}.tmp"
+        manifest.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.manifest_file)
+        self.logger.info(f"Row manifest saved: {len(manifest)} rows")
+
+    # Record the row hashes of a load written inside the database
+    def save_from_table(self):
+        if self.enabled and self._table_has_hashes():
+            self.save(self._read_table_hashes())
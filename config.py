@@ -7,6 +7,8 @@ CONFIG = {
     # File Paths
     "path": os.getenv("CS2025_DATA_PATH"),
     "excel_file": os.getenv("CS2025_EXCEL_FILE"),
+    # Batch mode: ingest every workbook matching this glob in the data path instead of excel_file
+    "excel_glob": os.getenv("CS2025_EXCEL_GLOB") or None,
 
     # DB Schema
     "schema": os.getenv("CS2025_SCHEMA"),
@@ -25,6 +27,67 @@ CONFIG = {
     "log_file_max_size": int(os.getenv("LOG_FILE_MAX_SIZE", 10)),
     "log_backup_count": int(os.getenv("LOG_BACKUP_COUNT", 5)),
     "exclude_sheets": os.getenv("CS2025_EXCLUDE_SHEETS").split(","),
+
+    # Bulk loading ("copy" streams rows via COPY ... FROM STDIN, "multi" uses multi-row INSERTs)
+    "bulk_load_method": os.getenv("CS2025_BULK_LOAD_METHOD", "copy").lower(),
+    "copy_chunksize": int(os.getenv("CS2025_COPY_CHUNKSIZE", 50000)),
+
+    # Connection pool (one engine shared by every stage, disposed when the run ends)
+    "pool_size": int(os.getenv("CS2025_POOL_SIZE", 5)),
+    "max_overflow": int(os.getenv("CS2025_MAX_OVERFLOW", 10)),
+    "pool_timeout": int(os.getenv("CS2025_POOL_TIMEOUT", 30)),
+    "pool_recycle": int(os.getenv("CS2025_POOL_RECYCLE", 1800)),
+    "pool_pre_ping": os.getenv("CS2025_POOL_PRE_PING", "true").lower() == "true",
+    "statement_timeout_ms": int(os.getenv("CS2025_STATEMENT_TIMEOUT_MS", 0)),
+    "application_name": os.getenv("CS2025_APPLICATION_NAME", "cs2025_etl"),
+
+    # psycopg2 executemany batching ("values_plus_batch" or "values_only") and rows per page
+    "executemany_mode": os.getenv("CS2025_EXECUTEMANY_MODE", "values_plus_batch"),
+    "executemany_page_size": int(os.getenv("CS2025_EXECUTEMANY_PAGE_SIZE", 1000)),
+
+    # Chunked reads (rows per chunk fetched through server-side cursors)
+    "read_chunksize": int(os.getenv("CS2025_READ_CHUNKSIZE", 50000)),
+
+    # Excel parsing (engine defaults to pandas' choice, 0 workers = one per CPU)
+    "excel_engine": os.getenv("CS2025_EXCEL_ENGINE") or None,
+    "parse_workers": int(os.getenv("CS2025_PARSE_WORKERS", 0)),
+
+    # Parsed sheet cache (Arrow IPC files keyed by workbook path and sheet content hash)
+    "sheet_cache": os.getenv("CS2025_SHEET_CACHE", "true").lower() == "true",
+    "sheet_cache_dir": os.getenv("CS2025_SHEET_CACHE_DIR", os.path.join("cache", "sheets")),
+    "sheet_cache_max_mb": int(os.getenv("CS2025_SHEET_CACHE_MAX_MB", 1024)),
+
+    # Streaming ingestion (rows flow through cleaning into the database in fixed-size chunks)
+    "streaming": os.getenv("CS2025_STREAMING", "false").lower() == "true",
+    "stream_chunk_size": int(os.getenv("CS2025_STREAM_CHUNK_SIZE", 50000)),
+
+    # Stage checkpoints (Parquet copies of stage outputs for --from / --only / --resume)
+    "checkpoint_dir": os.getenv("CS2025_CHECKPOINT_DIR", os.path.join("cache", "checkpoints")),
+
+    # In-memory integration (split, client sync, IDs and ordering before a single write per table)
+    "in_memory_integration": os.getenv("CS2025_IN_MEMORY_INTEGRATION", "false").lower() == "true",
+
+    # Phone lookup (normalized phone -> profileId table kept outside the rebuilt schema)
+    "lookup_schema": os.getenv("CS2025_LOOKUP_SCHEMA", "client_lookup"),
+
+    # Load mode ("full" drops and rebuilds the schema, "incremental" upserts new and changed rows)
+    "load_mode": os.getenv("CS2025_LOAD_MODE", "full").lower(),
+    # Range-partition complaints by month of logDate (opt-in; partitions are created as loads need them)
+    "partition_complaints": os.getenv("CS2025_PARTITION_COMPLAINTS", "false").lower() == "true",
+    # Incremental loads swap in a whole month partition when at least this share of its complaints changed
+    "partition_swap_fraction": float(os.getenv("CS2025_PARTITION_SWAP_FRACTION", 0.5)),
+    # Row hashes of the last load (complaintKey -> rowHash); incremental loads only push rows whose hash changed
+    "row_manifest_file": os.getenv("CS2025_ROW_MANIFEST_FILE", os.path.join("cache", "row_manifest.parquet")),
+
+    # Fuzzy canonicalization (JSON of {column: {"values": [...], "threshold": 80, "default": "Unknown"}})
+    "canonical_values_file": os.getenv("CS2025_CANONICAL_VALUES_FILE") or None,
+    "alias_cache_file": os.getenv("CS2025_ALIAS_CACHE_FILE", os.path.join("cache", "canonical_aliases.json")),
+
+    # Fuzzy customer matching (names scored within phone and initials + DOB blocks, against the next `window` rows);
+    # opt-in, since it changes which rows count as one customer and so the customerIds a load produces
+    "customer_resolution": os.getenv("CS2025_CUSTOMER_RESOLUTION", "false").lower() == "true",
+    "customer_match_threshold": int(os.getenv("CS2025_CUSTOMER_MATCH_THRESHOLD", 90)),
+    "customer_match_window": int(os.getenv("CS2025_CUSTOMER_MATCH_WINDOW", 10)),
 }
 
 
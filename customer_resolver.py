@@ -0,0 +1,101 @@
+from libs import *
+
+
+class CustomerResolver:
+
+    # Group customer rows that are the same person, scoring names only within blocking keys
+    def __init__(self, logger, threshold=90, window=10):
+        self.logger = logger
+        self.threshold = threshold
+        self.window = window
+
+    # Lowercase letters and single spaces, so case and spacing never count as differences
+    @staticmethod
+    def _normalize_names(names: pd.Series):
+        names = names.astype('string').str.lower().str.replace(r'[^a-z ]', '', regex=True)
+        names = names.str.split().str.join(' ')
+        return names.where(names.ne('') & names.ne('unknown'))
+
+    # Blocking keys: the phone's subscriber digits, and sorted name initials with the date of birth
+    def _blocks(self, df: pd.DataFrame, names: pd.Series):
+        phones = None
+        if 'number' in df.columns:
+            phones = df['number'].astype('string').str.replace(r'\D', '', regex=True).str[-9:]
+            phones = phones.where(phones.str.len() > 0)
+        initials = names.str.split().map(lambda parts: ''.join(sorted(part[0] for part in parts)), na_action='ignore').astype('string')
+        dob = df['dateOfBirth'].astype('string') if 'dateOfBirth' in df.columns else None
+
+        blocks = []
+        if phones is not None:
+            blocks.append(('phone', 'p:' + phones))
+        if dob is not None:
+            name_dob = 'n:' + initials + '|' + dob
+            # all names unknown (or no dates): nothing to block on
+            if name_dob.notna().any():
+                blocks.append(('name_dob', name_dob))
+        return blocks
+
+    # Candidate pairs: each row against the next `window` rows of its block, sorted by name (sorted neighbourhood)
+    def _candidate_pairs(self, block: pd.Series, names: pd.Series):
+        keyed = pd.DataFrame({'block': block, 'name': names.fillna('')})
+        keyed = keyed[block.notna().values].sort_values(['block', 'name'], kind='stable')
+        rows = keyed.index.to_numpy()
+        codes = pd.factorize(keyed['block'])[0]
+
+        left, right = [], []
+        for offset in range(1, min(self.window, len(rows) - 1) + 1):
+            same = codes[:-offset] == codes[offset:]
+            left.append(rows[:-offset][same])
+            right.append(rows[offset:][same])
+        if not left:
+            return np.array([], dtype=np.intp), np.array([], dtype=np.intp)
+        return np.concatenate(left), np.concatenate(right)
+
+    # Connected components of the match graph, by min-label propagation with pointer jumping
+    @staticmethod
+    def _components(count, left, right):
+        labels = np.arange(count)
+        while True:
+            low = np.minimum(labels[left], labels[right])
+            updated = labels.copy()
+            np.minimum.at(updated, left, low)
+            np.minimum.at(updated, right, low)
+            while True:
+                jumped = updated[updated]
+                if np.array_equal(jumped, updated):
+                    break
+                updated = jumped
+            if np.array_equal(updated, labels):
+                return labels
+            labels = updated
+
+    # Cluster ID per row; rows in the same cluster are the same customer
+    def resolve(self, df: pd.DataFrame):
+        start_time = time.time()
+        df = df.reset_index(drop=True)
+        if len(df) == 0:
+            return pd.Series([], dtype='int64')
+        names = self._normalize_names(df['name']) if 'name' in df.columns else pd.Series(pd.NA, index=df.index, dtype='string')
+
+        edges_left, edges_right = [], []
+        for kind, block in self._blocks(df, names):
+            left, right = self._candidate_pairs(block, names)
+
+            # a missing name can't contradict a shared phone, anywhere else both names must be present
+            both = (names.iloc[left].notna().values & names.iloc[right].notna().values)
+            matched = np.zeros(len(left), dtype=bool)
+            if both.any():
+                scores = process.cpdist(names.iloc[left[both]].tolist(), names.iloc[right[both]].tolist(),
+                                        scorer=fuzz.token_sort_ratio, processor=None, workers=-1)
+                matched[both] = scores >= self.threshold
+            if kind == 'phone':
+                matched |= ~both
+            self.logger.info(f"Customer matching on {kind}: {len(left)} candidate pairs, {matched.sum()} matches")
+            edges_left.append(left[matched])
+            edges_right.append(right[matched])
+
+        left, right = np.concatenate(edges_left or [[]]).astype(np.intp), np.concatenate(edges_right or [[]]).astype(np.intp)
+        clusters = pd.factorize(self._components(len(df), left, right))[0]
+        self.logger.info(f"Resolved {len(df)} customer rows into {clusters.max() + 1 if len(df) else 0} customers "
+                         f"in {time.time() - start_time:.2f}s")
+        return pd.Series(clusters, dtype='int64')
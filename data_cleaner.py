@@ -1,89 +1,133 @@
 from libs import *
-from logger import get_logger, log_df_info
+import json
+from config import CONFIG
+from canonicalizer import FuzzyCanonicalizer, AliasCache
+from logger import get_logger, log_df_info, log_debug_lazy
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
 
 logger = get_logger()
 
+VALID_REGIONS = [
+    "Ashanti Region", "Greater Accra Region", "Northern Region", "Volta Region",
+    "Central Region", "Western Region", "Upper West Region", "Upper East Region",
+    "Oti Region", "Savannah Region", "Bono East Region", "Western North Region",
+    "Brong Ahafo Region", "North East Region", "Ahafo Region", "Eastern Region"
+]
+
 class DataCleaner:
 
-    def __init__(self, df: pd.DataFrame, logger):
-        self.df = df.copy()
+    # Low-cardinality columns stored as categoricals, free-text columns as Arrow-backed strings
+    categorical_columns = [
+        'region', 'status', 'gender', 'accountType', 'branch', 'complaintSource',
+        'natureOfComplaint', 'location', 'assign', 'nameOfCcRep', 'sourceFile', 'sourceSheet'
+    ]
+    text_columns = ['name', 'subject', 'detailsOfComplaint', 'comment', 'updates', 'reasonForReversalRequest']
+    # Batch ingestion tags each row with its workbook and sheet; they don't make rows distinct
+    source_columns = ['sourceFile', 'sourceSheet']
+
+    def __init__(self, df: pd.DataFrame, logger, copy=True):
+        self.copy = copy
+        self.df = df.copy() if copy else df
         self.logger = logger
 
     # Private Helper Methods(Helper Functions)
 
-    # Clean name column
-    def _clean_name(self, name):
-        if pd.isna(name) or name.strip().lower() in ['nan', 'none', 'null', '']:
-            return "Unknown"
-        cleaned =  str(name).strip()
-        self.logger.debug(f"Cleaned name: {cleaned}")
-        return cleaned
+    # Clean name column (vectorized): strip whitespace, missing and placeholder names become "Unknown"
+    def _clean_names(self, names: pd.Series):
+        cleaned = names.astype('string').str.strip()
+        unknown = cleaned.isna() | cleaned.str.lower().isin(['nan', 'none', 'null', '']).fillna(False)
+        return cleaned.mask(unknown, "Unknown"), int(unknown.sum())
     
     # lower camel case
     def _to_lower_camel(self, s: str):
         parts = s.strip().split(' ')
         return parts[0].lower() + ''.join(word.title() for word in parts[1:])
     
-    # Clean region column
-    def _correct_region(self, region_name, valid_regions, threshold=80):
-        if pd.isna(region_name):
-            return "Unknown"
-        match, score, _ = process.extractOne(region_name, valid_regions, scorer=fuzz.token_set_ratio)
-        return match if score >= threshold else "Unknown"
-
-    # Format phone number column
-    def _format_phone_number(self, phone):
-        if pd.isna(phone):
-            return np.nan
-        
-        phone_str = str(phone).strip()
-        if phone_str.lower() in ['nan', 'none', 'null', '']:
-            return np.nan
-        
-        digits = re.sub(r'\D', '', phone_str)
-        if not digits or len(digits) < 9:
-            return np.nan
-        
-        if digits.startswith('0') and len(digits) == 10:
-            return '+233' + digits[1:]       
-        elif digits.startswith('233') and len(digits) == 12:
-            return '+' + digits
-        elif len(digits) == 9:
-            return '+233' + digits
-        
-        return np.nan
+    # Canonical values per categorical column (region built in, others from CS2025_CANONICAL_VALUES_FILE)
+    def _canonical_columns(self):
+        columns = {'region': {'values': VALID_REGIONS}}
+        values_file = CONFIG.get('canonical_values_file')
+        if values_file:
+            with open(values_file, encoding='utf-8') as f:
+                columns.update(json.load(f))
+        return columns
+
+    # Format phone number column (vectorized), returning numbers and a reason code for each rejected row
+    def _format_phone_numbers(self, phones: pd.Series):
+        # normalize each distinct value once, then broadcast back (-1 codes index the trailing missing slot)
+        codes, uniques = pd.factorize(phones)
+        formatted, reasons = self._normalize_phones(pd.Series(uniques, dtype=object))
+        formatted = np.append(formatted.to_numpy(dtype=object), np.nan)
+        reasons = np.append(reasons.to_numpy(dtype=object), 'missing')
+        return pd.Series(formatted[codes], index=phones.index, dtype=object), pd.Series(reasons[codes], index=phones.index, dtype=object)
+
+    # Normalize distinct phone values to +233 form with string ops
+    def _normalize_phones(self, phones: pd.Series):
+        # numeric Excel columns with blanks are read as floats, so drop the ".0" of integral values
+        phone_str = phones.astype('string').str.strip().str.replace(r'^(\d+)\.0$', r'\1', regex=True)
+        missing = phones.isna()
+        placeholder = phone_str.str.lower().isin(['nan', 'none', 'null', '']).fillna(False) & ~missing
+
+        digits = phone_str.str.replace(r'\D', '', regex=True)
+        length = digits.str.len().fillna(0)
+        too_short = length < 9
+
+        local = (digits.str.startswith('0') & (length == 10)).fillna(False)
+        international = (digits.str.startswith('233') & (length == 12)).fillna(False)
+        national = (length == 9) & ~local & ~international
+        valid = ~missing & ~placeholder & ~too_short & (local | international | national)
+
+        formatted = pd.Series(np.nan, index=phones.index, dtype=object)
+        formatted[valid & local] = '+233' + digits[valid & local].str[1:]
+        formatted[valid & international] = '+' + digits[valid & international]
+        formatted[valid & national] = '+233' + digits[valid & national]
+
+        reasons = pd.Series(
+            np.select([missing, placeholder, too_short, ~valid], ['missing', 'placeholder', 'too_short', 'invalid_format'], default=None),
+            index=phones.index, dtype=object
+        )
+        return formatted, reasons
     
     # Title case
     def _title_case(self, text):
         return text.title() if isinstance(text, str) else text
+
+    # Convert string columns to compact dtypes (categoricals, Arrow-backed strings when pyarrow is installed)
+    def _compact_dtypes(self, df):
+        for col in df.columns:
+            if not (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+                continue
+            if col in self.categorical_columns:
+                df[col] = df[col].astype('category')
+            elif col in self.text_columns and pa is not None:
+                df[col] = df[col].astype(pd.StringDtype("pyarrow"))
+        return df
     
 
     # Main Cleaning Logic
     def clean_columns(self):
         self.logger.info("Starting column cleaning process")
 
-        df = self.df.copy()
+        df = self.df.copy() if self.copy else self.df
         log_df_info("Original DataFrame", df)
-
-        valid_regions = [
-            "Ashanti Region", "Greater Accra Region", "Northern Region", "Volta Region",
-            "Central Region", "Western Region", "Upper West Region", "Upper East Region",
-            "Oti Region", "Savannah Region", "Bono East Region", "Western North Region",
-            "Brong Ahafo Region", "North East Region", "Ahafo Region", "Eastern Region"
-        ]
+        memory_before = df.memory_usage(deep=True).sum()
 
         # clean name column
         if 'name' in df.columns:
             self.logger.info("Cleaning name column")
-            df['name'] = df['name'].apply(self._clean_name)
-            self.logger.info("Name column cleaning completed")
+            df['name'], unknown = self._clean_names(df['name'])
+            self.logger.info(f"Name column cleaning completed: {len(df) - unknown} names cleaned, {unknown} set to Unknown")
 
         # normalize column names
         self.logger.info("Normalizing column names")
         original_columns = df.columns.tolist()
         df.columns = [self._to_lower_camel(col) for col in df.columns]
         df.columns = df.columns.str.replace(' ', '', regex=False)
-        self.logger.debug(f"Normalized column names: {df.columns.tolist()}")
+        log_debug_lazy(lambda: f"Normalized column names: {df.columns.tolist()}")
 
         # rename key columns
         rename_dict = {}
@@ -107,17 +151,27 @@ class DataCleaner:
             df[col] = df[col].str.strip()
 
         # apply title case (excluding IDs and phone columns)
-        exclude_cols = ['number', 'number2', 'branch', 'customerId', 'profileId']
+        exclude_cols = ['number', 'number2', 'branch', 'customerId', 'profileId'] + self.source_columns
         for col in [c for c in df.select_dtypes(include=['object']).columns if c not in exclude_cols]:
             df[col] = df[col].apply(self._title_case)
 
-        #correct region names
-        if 'region' in df.columns:
-            df['region'] = df['region'].apply(lambda x: self._correct_region(x, valid_regions))
+        # correct region (and other configured categorical) spellings
+        alias_cache = AliasCache(CONFIG['alias_cache_file'], self.logger) if CONFIG.get('alias_cache_file') else None
+        for col, options in self._canonical_columns().items():
+            if col in df.columns:
+                canonicalizer = FuzzyCanonicalizer(
+                    col, options['values'], self.logger, threshold=options.get('threshold', 80),
+                    default=options.get('default', "Unknown"), cache=alias_cache
+                )
+                df[col] = canonicalizer.canonicalize(df[col])
 
         # format phone numbers
-        if 'number' in df.columns:
-            df['number'] = df['number'].apply(self._format_phone_number)
+        self.phone_reasons = {}
+        for col in ['number', 'number2']:
+            if col in df.columns:
+                df[col], self.phone_reasons[col] = self._format_phone_numbers(df[col])
+                rejected = self.phone_reasons[col].value_counts()
+                self.logger.info(f"Formatted {col}: {len(df) - rejected.sum()} valid, rejected {rejected.to_dict()}")
         
         # Convert date columns
         for col in ['logDate', 'resolutionDate', 'dateOfBirth']:
@@ -125,19 +179,50 @@ class DataCleaner:
                 df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
 
         
-        df = df.drop_duplicates()
-        self.logger.info(f"Cleaned data {df.shape[0] - df.drop_duplicates().shape[0]} duplicate rows")
+        # compact dtypes before deduplicating so the hashing works on codes rather than python strings
+        df = self._compact_dtypes(df)
+        memory_after = df.memory_usage(deep=True).sum()
+        self.logger.info(f"Memory: {memory_before / 1024 / 1024:.1f} MB -> {memory_after / 1024 / 1024:.1f} MB "
+                         f"({memory_after / memory_before:.0%} of original)" if memory_before else "Memory: empty DataFrame")
+
+        # one hash per row, so duplicates are found by comparing a single int64 instead of every wide text column
+        df = self.add_row_hashes(df)
+        rows_before = len(df)
+        df = df.drop_duplicates(subset=['rowHash'])
+        self.logger.info(f"Cleaned data {rows_before - len(df)} duplicate rows")
         log_df_info("Cleaned DataFrame", df)
 
         self.df = df
         return df
     
 
+    # Stable 64-bit hash of each row's content, used to deduplicate and to detect changes between runs
+    @classmethod
+    def add_row_hashes(cls, df: pd.DataFrame):
+        parts = pd.DataFrame(index=df.index)
+        for col in sorted(col for col in df.columns if col not in cls.source_columns + ['rowHash']):
+            # categoricals and strings hash by value, anything else by its text so the hash doesn't depend on dtypes
+            if isinstance(df[col].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(df[col]):
+                parts[col] = df[col]
+            else:
+                parts[col] = df[col].astype('string')
+        df['rowHash'] = pd.util.hash_pandas_object(parts, index=False).values.view('int64')
+        return df
+
+    # Clean and validate a stream of chunks; rows repeated across chunks are collapsed later, in SQL, when the
+    # streamed table is split (setup_schema_from_table), so memory stays bounded by the chunk size
+    @classmethod
+    def clean_chunks(cls, chunks, logger):
+        for chunk in chunks:
+            cleaner = cls(chunk, logger, copy=False)
+            cleaner.df = cleaner.clean_columns()
+            yield cleaner.validate_and_calculate_tat()
+
     # TAT Validation
     def validate_and_calculate_tat(self):
         self.logger.info("Validating and calculating TAT")
 
-        df = self.df.copy()
+        df = self.df.copy() if self.copy else self.df
 
         needed = ['logDate', 'resolutionDate', 'turnaroundTime']
         if not all(col in df.columns for col in needed):
@@ -1,7 +1,41 @@
 from sqlalchemy import text
-import ulid
+import os
+import time
 from libs import pd
 import numpy as np
+from db_handler import bulk_to_sql, read_sql_chunks, bump_data_version
+from schema_manager import SchemaManager, is_partitioned, create_month_partitions, create_customer_summary
+from logger import log_db_ops
+from config import CONFIG
+from customer_resolver import CustomerResolver
+
+ULID_ALPHABET = np.frombuffer(b"0123456789ABCDEFGHJKMNPQRSTVWXYZ", dtype=np.uint8)
+
+
+# Generate ULIDs in bulk: one millisecond timestamp, 80 random bits each, Crockford base32 encoded with NumPy
+def new_ulids(count):
+    timestamp = np.uint64(int(time.time() * 1000))
+    randomness = np.frombuffer(os.urandom(10 * count), dtype=np.uint8).reshape(count, 10).astype(np.uint64)
+
+    # split the 128-bit values into high and low 64-bit words
+    hi = (timestamp << np.uint64(16)) | (randomness[:, 0] << np.uint64(8)) | randomness[:, 1]
+    lo = np.zeros(count, dtype=np.uint64)
+    for i in range(2, 10):
+        lo = (lo << np.uint64(8)) | randomness[:, i]
+
+    # 26 characters of 5 bits each, most significant first
+    chars = np.empty((count, 26), dtype=np.uint8)
+    for i in range(26):
+        shift = 125 - 5 * i
+        if shift >= 64:
+            bits = hi >> np.uint64(shift - 64)
+        elif shift > 59:
+            bits = (lo >> np.uint64(shift)) | (hi << np.uint64(64 - shift))
+        else:
+            bits = lo >> np.uint64(shift)
+        chars[:, i] = ULID_ALPHABET[(bits & np.uint64(31)).astype(np.intp)]
+    return chars.view("S26").ravel().astype(str).astype(object)
+
 
 class DataIntegrator:
 
@@ -12,41 +46,136 @@ class DataIntegrator:
         self.logger = logger
         self.logger.info("DataIntegrator initialized with engine and schema.")
 
-    # Assign customerIds to complaints
+    customer_final_order = [
+        'customerId', 'profileId', 'name', 'number', 'number2',
+        'gender', 'dateOfBirth', 'accountType', 'branch'
+    ]
+    complaint_final_order = [
+        'customerId', 'profileId', 'number', 'number2', 'location', 'region',
+        'complaintSource', 'natureOfComplaint', 'subject', 'detailsOfComplaint',
+        'comment', 'updates', 'status', 'logDate', 'turnaroundTime', 
+        'resolutionDate', 'reasonForReversalRequest'
+    ]
+
+    # Assign customerIds and fill the declared customers and complaints tables from the load tables
     def assign_customer_ids(self):
+        load = SchemaManager.load_tables
+        # only the distinct identifiers come to the client, read in chunks; complaints never leave the database
+        with self.engine.connect() as conn:
+            key = self._customer_key(self._table_columns(conn, load['customers']))
+        profile_keys, number_keys = self._read_customer_keys(key)
+        ids = new_ulids(len(profile_keys) + len(number_keys))
+        profile_ids = pd.DataFrame({'profileId': profile_keys, 'customerId': ids[:len(profile_keys)]})
+        number_ids = pd.DataFrame({key: number_keys, 'customerId': ids[len(profile_keys):]})
+        self.logger.info(f"Generated customerIds for {len(profile_keys)} profileIds and {len(number_keys)} {key} values")
+
         with self.engine.begin() as conn:
-            customers_df = pd.read_sql(f"SELECT * FROM {self.schema_name}.customers", conn)
-            complaints_df = pd.read_sql(f"SELECT * FROM {self.schema_name}.complaints", conn)
+            for stage, df in (('_profile_ids', profile_ids), ('_number_ids', number_ids)):
+                key_type = 'BIGINT' if df.columns[0] == 'clusterId' else 'TEXT'
+                conn.execute(text(f"DROP TABLE IF EXISTS {self.schema_name}.{stage};"))
+                conn.execute(text(f'CREATE UNLOGGED TABLE {self.schema_name}.{stage} ("{df.columns[0]}" {key_type}, "customerId" TEXT);'))
+                bulk_to_sql(df, stage, conn, self.logger, schema=self.schema_name, if_exists="append")
+
+            # resolve customerIds (profileId first, then cluster or number) while reading each load table once
+            resolved = 'COALESCE(p."customerId", n."customerId")'
+            joins = f"""
+                LEFT JOIN {self.schema_name}._profile_ids p ON p."profileId" = t."profileId"
+                LEFT JOIN {self.schema_name}._number_ids n ON n."{key}" = t."{key}"
+            """
+            customer_cols, customer_values = self._insert_columns(conn, 'customers', resolved)
+            complaint_cols, complaint_values = self._insert_columns(conn, 'complaints', resolved)
+
+            # rows without a customerId or phone are left behind, and one customer kept per customerId (the first loaded)
+            customers = conn.execute(text(f"""
+                INSERT INTO {self.schema_name}.customers ({customer_cols})
+                SELECT DISTINCT ON ({resolved}) {customer_values}
+                FROM {self.schema_name}.{load['customers']} t {joins}
+                WHERE {resolved} IS NOT NULL AND t."number" IS NOT NULL
+                ORDER BY {resolved}, t.ctid;
+            """)).rowcount
+            if is_partitioned(conn, self.schema_name, 'complaints'):
+                months = conn.execute(text(f"""
+                    SELECT DISTINCT date_trunc('month', COALESCE(CAST("logDate" AS DATE), CURRENT_DATE))::date
+                    FROM {self.schema_name}.{load['complaints']};
+                """)).scalars().all()
+                create_month_partitions(conn, self.schema_name, months, self.logger)
+            complaints = conn.execute(text(f"""
+                INSERT INTO {self.schema_name}.complaints ({complaint_cols})
+                SELECT {complaint_values}
+                FROM {self.schema_name}.{load['complaints']} t {joins}
+                WHERE {resolved} IS NOT NULL AND t."number" IS NOT NULL;
+            """)).rowcount
+
+            conn.execute(text(f"DROP TABLE {self.schema_name}.{load['customers']}, {self.schema_name}.{load['complaints']};"))
+            conn.execute(text(f"DROP TABLE {self.schema_name}._profile_ids, {self.schema_name}._number_ids;"))
+            create_customer_summary(conn, self.schema_name, self.logger)
+            bump_data_version(conn, self.schema_name, 'customers', 'complaints')
+
+        log_db_ops("INSERT", f"{self.schema_name}.customers", customers)
+        log_db_ops("INSERT", f"{self.schema_name}.complaints", complaints)
+        self.logger.info(f"Customer IDs assigned: {customers} customers, {complaints} complaints")
+
+    # Column list and SELECT expressions filling a declared table from its load table, with the NULL fix-ups
+    # (unknown names, missing log dates) applied as rows are copied; the table's constraints validate the rest
+    def _insert_columns(self, conn, table, resolved):
+        load_columns = self._table_columns(conn, SchemaManager.load_tables[table])
+        defaults = {'name': "'Unknown'", 'logDate': 'CURRENT_DATE'}
+        columns, values = ['"customerId"'], [resolved]
+        for col, sql_type in SchemaManager.table_types[table].items():
+            if col == 'customerId' or col not in load_columns:
+                continue
+            value = f't."{col}"' if sql_type.startswith(('VARCHAR', 'TEXT')) else f'CAST(t."{col}" AS {sql_type})'
+            columns.append(f'"{col}"')
+            values.append(f"COALESCE({value}, {defaults[col]})" if col in defaults else value)
+        return ", ".join(columns), ", ".join(values)
+
+    # Distinct profileIds, and clusters (or numbers) of customers without one, streamed from the customers load table
+    def _read_customer_keys(self, key='number'):
+        profile_keys, number_keys = [], []
+        for chunk in read_sql_chunks(self.engine, SchemaManager.load_tables['customers'], self.logger, schema=self.schema_name,
+                                     columns=list(dict.fromkeys(['profileId', 'number', key]))):
+            has_profile = chunk['profileId'].notna()
+            profile_keys.append(chunk.loc[has_profile, 'profileId'].unique())
+            number_keys.append(chunk.loc[~has_profile & chunk['number'].notna(), key].unique())
+
+        profile_keys = pd.unique(np.concatenate(profile_keys)) if profile_keys else np.array([], dtype=object)
+        number_keys = pd.unique(np.concatenate(number_keys)) if number_keys else np.array([], dtype=object)
+        return profile_keys, number_keys
+
+    # Customers without a profileId are keyed by their resolved cluster when split_data labelled one, else by number
+    def _customer_key(self, columns):
+        return 'clusterId' if 'clusterId' in columns else 'number'
 
+    # Column names of a table in the schema, in table order
+    def _table_columns(self, conn, table):
+        return conn.execute(text("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = :schema AND table_name = :table
+            ORDER BY ordinal_position
+        """), {"schema": self.schema_name, "table": table}).scalars().all()
+
+    # Assign customerIds to in-memory customers and complaints
+    def assign_ids(self, customers_df: pd.DataFrame, complaints_df: pd.DataFrame):
         self.logger.info(f"Starting with {len(customers_df)} customers, {len(complaints_df)} complaints")
         self.logger.info(f"Customers profileId stats - Not null: {customers_df['profileId'].notna().sum()}, Null: {customers_df['profileId'].isna().sum()}")
     
-        # Build profileId->ULID mapping
-        profile_to_ulid = {}
-        for idx, row in customers_df.iterrows():
-            pid = row['profileId']
-            if pd.notna(pid) and pid not in profile_to_ulid:
-                profile_to_ulid[pid] = str(ulid.new())
-        
-        # Map phone numbers for rows without profileId
-        for idx, row in customers_df.iterrows():
-            if pd.isna(row['profileId']) and pd.notna(row['number']):
-                phone_key = f"number:{row['number']}"
-                if phone_key not in profile_to_ulid:
-                    profile_to_ulid[phone_key] = str(ulid.new())
-
-        # Resolve customerId function
-        def resolve_customer_id(row):
-            if pd.notna(row['profileId']) and row['profileId'] in profile_to_ulid:
-                return profile_to_ulid[row['profileId']]
-            elif pd.notna(row['number']):
-                phone_key = f"number:{row['number']}"  
-                return profile_to_ulid.get(phone_key)
-            return None
+        # One ULID per distinct profileId, and per distinct customer cluster (or number) among customers without one
+        key = self._customer_key(customers_df.columns)
+        has_profile = customers_df['profileId'].notna()
+        profile_keys = pd.Index(customers_df.loc[has_profile, 'profileId'].unique())
+        number_keys = pd.Index(customers_df.loc[~has_profile & customers_df['number'].notna(), key].unique())
+        ids = new_ulids(len(profile_keys) + len(number_keys))
+        profile_to_ulid = pd.Series(ids[:len(profile_keys)], index=profile_keys, dtype=object)
+        number_to_ulid = pd.Series(ids[len(profile_keys):], index=number_keys, dtype=object)
+
+        # Resolve customerIds: profileId first, then the customer cluster or phone number
+        def resolve_customer_ids(df):
+            by_profile = df['profileId'].map(profile_to_ulid)
+            return by_profile.fillna(df[key].map(number_to_ulid)).astype(object)
 
         # Assign customerIds
-        customers_df['customerId'] = customers_df.apply(resolve_customer_id, axis=1)
-        complaints_df['customerId'] = complaints_df.apply(resolve_customer_id, axis=1)
+        customers_df['customerId'] = resolve_customer_ids(customers_df)
+        complaints_df['customerId'] = resolve_customer_ids(complaints_df)
 
         # Remove rows with no identifiers
         no_identifiers = customers_df[
@@ -67,117 +196,75 @@ class DataIntegrator:
         # Filter complaints to only include valid customerIds
         complaints_df = complaints_df[complaints_df['customerId'].isin(customers_df['customerId'])]
 
-        # Write back to DB
-        with self.engine.begin() as conn:
-            customers_df.to_sql("customers", conn, schema=self.schema_name, if_exists="replace", index=False)
-            complaints_df.to_sql("complaints", conn, schema=self.schema_name, if_exists="replace", index=False)
+        # clusters only matter for this assignment
+        customers_df = customers_df.drop(columns=['clusterId'], errors='ignore')
+        complaints_df = complaints_df.drop(columns=['clusterId'], errors='ignore')
 
         self.logger.info(f"Customer IDs assigned: {len(customers_df)} customers, {len(complaints_df)} complaints")
+        return customers_df, complaints_df
 
-    # Reorder table columns
-    def reorder_table_columns(self):
-        
-        with self.engine.begin() as conn:
-            # Customers table
-            customers_df = pd.read_sql(f"SELECT * FROM {self.schema_name}.customers", conn)
-            customer_final_order = [
-                'customerId', 'profileId', 'name', 'number', 'number2',
-                'gender', 'dateOfBirth', 'accountType', 'branch'
-            ]
-            customer_final_order = [col for col in customer_final_order if col in customers_df.columns]
-            customer_final_order += [col for col in customers_df.columns if col not in customer_final_order]
-            customers_df = customers_df[customer_final_order]
-            customers_df.to_sql("customers", conn, schema=self.schema_name, if_exists="replace", index=False)
-
-            # Complaints table  
-            complaints_df = pd.read_sql(f"SELECT * FROM {self.schema_name}.complaints", conn)
-            complaint_final_order = [
-                'customerId', 'profileId', 'number', 'number2', 'location', 'region',
-                'complaintSource', 'natureOfComplaint', 'subject', 'detailsOfComplaint',
-                'comment', 'updates', 'status', 'logDate', 'turnaroundTime', 
-                'resolutionDate', 'reasonForReversalRequest'
-            ]
-            complaint_final_order = [col for col in complaint_final_order if col in complaints_df.columns]
-            complaint_final_order += [col for col in complaints_df.columns if col not in complaint_final_order]
-            complaints_df = complaints_df[complaint_final_order]
-            complaints_df.to_sql("complaints", conn, schema=self.schema_name, if_exists="replace", index=False)
+    # Put known columns first, in their final order, followed by any others
+    def order_columns(self, df: pd.DataFrame, final_order):
+        return df[self.ordered_column_names(df.columns, final_order)]
 
+    def ordered_column_names(self, columns, final_order):
+        ordered = [col for col in final_order if col in columns]
+        return ordered + [col for col in columns if col not in ordered]
+
+    # Assign IDs and order columns in memory, ready for a single write per table
+    def prepare_tables(self, customers_df: pd.DataFrame, complaints_df: pd.DataFrame):
+        customers_df, complaints_df = self.assign_ids(customers_df, complaints_df)
+        customers_df = self.order_columns(customers_df, self.customer_final_order)
+        complaints_df = self.order_columns(complaints_df, self.complaint_final_order)
         self.logger.info("Final column ordering completed!")
+        return customers_df, complaints_df
 
-    # Apply database constraints
-    def apply_constraints(self):
-        
-        self.logger.info("Adding database constraints...")
-        with self.engine.begin() as conn:
-            # Clean up NULL values
-            conn.execute(text(f"""
-                UPDATE {self.schema_name}.customers
-                SET name = 'Unknown'
-                WHERE name IS NULL;
-            """))
-
-            # Delete NULL phone numbers
-            null_number_count = conn.execute(text(f"SELECT COUNT(*) FROM {self.schema_name}.customers WHERE \"number\" IS NULL")).scalar()
-            if null_number_count > 0:
-                conn.execute(text(f"DELETE FROM {self.schema_name}.customers WHERE \"number\" IS NULL"))
-                conn.execute(text(f"DELETE FROM {self.schema_name}.complaints WHERE \"number\" IS NULL"))
-
-            # Set NULL logDate to current date
-            conn.execute(text(f"""
-                UPDATE {self.schema_name}.complaints
-                SET \"logDate\" = CURRENT_DATE
-                WHERE \"logDate\" IS NULL;
-            """))
-
-            # Handle NULL customerIds
-            null_count = conn.execute(text(f"SELECT COUNT(*) FROM {self.schema_name}.customers WHERE \"customerId\" IS NULL")).scalar()
-            if null_count > 0:
-                conn.execute(text(f"""
-                    UPDATE {self.schema_name}.customers
-                    SET \"customerId\" = CONCAT('ULID_', MD5(RANDOM()::TEXT || CLOCK_TIMESTAMP()::TEXT))
-                    WHERE \"customerId\" IS NULL;
-                """))
-
-            # Verify no NULLs remain
-            tables_to_check = {
-                f"{self.schema_name}.customers": ["number", "name", "customerId"],
-                f"{self.schema_name}.complaints": ["number", "logDate", "customerId"]
-            }
-            
-            for table, columns in tables_to_check.items():
-                for column in columns:
-                    result = conn.execute(text(f"SELECT COUNT(*) FROM {table} WHERE \"{column}\" IS NULL;"))
-                    null_count = result.scalar()
-                    if null_count > 0:
-                        raise Exception(f"Cannot apply NOT NULL constraints - NULL values in {table}.{column}")
-
-            # Add constraints
-            conn.execute(text(f"ALTER TABLE {self.schema_name}.customers ADD PRIMARY KEY (\"customerId\");"))
-            conn.execute(text(f"""
-                ALTER TABLE {self.schema_name}.complaints
-                ADD CONSTRAINT fk_complaints_customer
-                FOREIGN KEY (\"customerId\")
-                REFERENCES {self.schema_name}.customers(\"customerId\");
-            """))
-            conn.execute(text(f"""
-                ALTER TABLE {self.schema_name}.customers
-                ALTER COLUMN "customerId" SET NOT NULL,
-                ALTER COLUMN "number" SET NOT NULL,
-                ALTER COLUMN "name" SET NOT NULL;
-                
-                ALTER TABLE {self.schema_name}.complaints
-                ALTER COLUMN "customerId" SET NOT NULL,
-                ALTER COLUMN "number" SET NOT NULL,
-                ALTER COLUMN "logDate" SET NOT NULL;
-            """))
-
-        self.logger.info("Database constraints applied successfully!")
+    # Reuse customerIds already in the database for customers seen in earlier loads
+    def reuse_existing_ids(self, customers_df: pd.DataFrame, complaints_df: pd.DataFrame):
+        resolution = CONFIG.get('customer_resolution') and all(col in customers_df.columns for col in ['name', 'dateOfBirth'])
+        columns = ['customerId', 'profileId', 'number'] + (['name', 'dateOfBirth'] if resolution else [])
+        existing = pd.concat(read_sql_chunks(self.engine, 'customers', self.logger, schema=self.schema_name,
+                                             columns=columns), ignore_index=True)
+
+        by_profile = existing.dropna(subset=['profileId']).drop_duplicates(subset=['profileId']).set_index('profileId')['customerId']
+        if resolution:
+            # match the way split_data does: resolve stored and incoming customers together, so differently named
+            # customers sharing a phone stay apart and a full rebuild and an incremental run agree
+            resolver = CustomerResolver(self.logger, threshold=CONFIG['customer_match_threshold'],
+                                        window=CONFIG['customer_match_window'])
+            both = pd.concat([existing[['name', 'number', 'dateOfBirth']], customers_df[['name', 'number', 'dateOfBirth']]],
+                             ignore_index=True)
+            both['dateOfBirth'] = pd.to_datetime(both['dateOfBirth'], errors='coerce')
+            clusters = resolver.resolve(both).values
+            by_cluster = pd.Series(existing['customerId'].values, index=clusters[:len(existing)])
+            by_cluster = by_cluster[~by_cluster.index.duplicated()]
+            by_key = pd.Series(clusters[len(existing):], index=customers_df.index).map(by_cluster)
+        else:
+            by_number = existing.dropna(subset=['number']).drop_duplicates(subset=['number']).set_index('number')['customerId']
+            by_key = customers_df['number'].map(by_number)
+        found = customers_df['profileId'].map(by_profile).fillna(by_key)
+
+        # new ULID -> existing customerId, then dedupe customers that now share one
+        remap = pd.Series(found.values, index=customers_df['customerId'].values)[found.notna().values]
+        remap = remap[~remap.index.duplicated()]
+        customers_df = customers_df.assign(customerId=customers_df['customerId'].map(remap).fillna(customers_df['customerId']))
+        customers_df = customers_df.drop_duplicates(subset=['customerId'])
+        complaints_df = complaints_df.assign(customerId=complaints_df['customerId'].map(remap).fillna(complaints_df['customerId']))
+
+        self.logger.info(f"Reused {found.notna().sum()} existing customerIds, {found.isna().sum()} new customers")
+        return customers_df, complaints_df
+
+    # Apply the NULL clean-up rules in memory (for loads into constrained tables)
+    def apply_null_rules(self, customers_df: pd.DataFrame, complaints_df: pd.DataFrame):
+        customers_df = customers_df.assign(name=customers_df['name'].fillna('Unknown'))
+        customers_df = customers_df[customers_df['number'].notna()]
+        complaints_df = complaints_df[complaints_df['number'].notna()]
+        complaints_df = complaints_df.assign(logDate=complaints_df['logDate'].fillna(pd.Timestamp.now().date()))
+        return customers_df, complaints_df
 
     # Run the full data integration pipeline
     def run_full_integration(self):
         
         self.logger.info("Starting data integration pipeline...")
         self.assign_customer_ids()
-        self.reorder_table_columns()
-        self.apply_constraints()
         self.logger.info("Data integration pipeline completed successfully!")
\ No newline at end of file
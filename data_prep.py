@@ -1,5 +1,33 @@
 from libs import *
+import glob
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
+from pandas.io.parsers import TextParser
+from config import CONFIG
 from logger import log_step_start, log_step_complete
+from sheet_cache import SheetCache
+
+
+# Parse a single sheet (module level so it can be pickled into worker processes)
+def parse_sheet(full_path, sheet_name, engine=None):
+    return pd.read_excel(full_path, sheet_name=sheet_name, engine=engine)
+
+
+# Convert a raw openpyxl value the same way pandas' Excel reader does
+def convert_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+# Convert a row of raw values, trimming trailing empty cells like read_excel
+def convert_row(row):
+    converted = [convert_cell(value) for value in row]
+    while converted and converted[-1] == "":
+        converted.pop()
+    return converted
 
 
 class CustomerSupportDataPrep:
@@ -8,28 +36,96 @@ class CustomerSupportDataPrep:
         self.path = path
         self.excel_file = excel_file
         self.logger = logger
+        self.excel_glob = CONFIG.get('excel_glob')
+        self.sheet_cache = None
+        if CONFIG.get('sheet_cache'):
+            self.sheet_cache = SheetCache(CONFIG['sheet_cache_dir'], CONFIG['sheet_cache_max_mb'], logger,
+                                          excel_engine=CONFIG.get('excel_engine'))
 
-    # load Excel data 
-    def load_excel_data(self):
-        log_step_start("Loading Excel data", path=self.path, excel_file=self.excel_file)
+    # Workbooks to ingest: every match of CS2025_EXCEL_GLOB in the data path (batch mode), otherwise the one excel_file
+    def workbook_paths(self):
+        if not self.excel_glob:
+            paths = [os.path.join(self.path, self.excel_file)]
+        else:
+            # skip the lock files Excel leaves next to open workbooks
+            paths = sorted(path for path in glob.glob(os.path.join(self.path, self.excel_glob))
+                           if not os.path.basename(path).startswith('~$'))
+            if not paths:
+                error_msg = f"No workbooks matching {self.excel_glob} in {self.path}!"
+                self.logger.error(error_msg)
+                raise FileNotFoundError(error_msg)
 
-        try:
-            full_path = os.path.join(self.path, self.excel_file)
-            
-            # Check if file exists
+        # Check if file exists
+        for full_path in paths:
             if not os.path.exists(full_path):
                 error_msg = f"Excel file not found at {full_path}!"
                 self.logger.error(error_msg)
                 raise FileNotFoundError(error_msg)
+        return paths
+
+    # Tag rows with the workbook and sheet they came from (batch mode)
+    def _tag_source(self, df, full_path, sheet_name):
+        df['Source File'] = os.path.basename(full_path)
+        df['Source Sheet'] = sheet_name
+        return df
+
+    # load Excel data 
+    def load_excel_data(self, exclude_sheets=None):
+        log_step_start("Loading Excel data", path=self.path, excel_file=self.excel_glob or self.excel_file)
+
+        try:
+            paths = self.workbook_paths()
             
-            # Load each sheet into a DataFrame
-            cs2025 = pd.ExcelFile(full_path)
-            self.dataframes = {sheet_name: cs2025.parse(sheet_name) for sheet_name in cs2025.sheet_names}
+            # List sheets and skip excluded ones before parsing anything
+            engine = CONFIG.get('excel_engine')
+            work = []
+            for full_path in paths:
+                with pd.ExcelFile(full_path, engine=engine) as cs2025:
+                    work += [(full_path, name) for name in cs2025.sheet_names if name not in (exclude_sheets or [])]
+            self.logger.info(f"Parsing {len(work)} sheets from {len(paths)} workbooks (excluded: {exclude_sheets or []})")
+
+            # Reuse cached sheets whose content hasn't changed since the last run
+            cached, hashes = {}, {}
+            if self.sheet_cache is not None and self.sheet_cache.enabled:
+                for full_path in paths:
+                    sheet_names = [name for path, name in work if path == full_path]
+                    for sheet_name, content_hash in self.sheet_cache.sheet_hashes(full_path, sheet_names).items():
+                        hashes[(full_path, sheet_name)] = content_hash
+                        df = self.sheet_cache.load(full_path, sheet_name, content_hash)
+                        if df is not None:
+                            cached[(full_path, sheet_name)] = df
+                self.logger.info(f"Sheet cache: {len(cached)} hits, {len(work) - len(cached)} misses")
+            to_parse = [item for item in work if item not in cached]
+
+            # Load each sheet into a DataFrame, in parallel worker processes when there is more than one
+            workers = min(CONFIG.get('parse_workers') or os.cpu_count() or 1, len(to_parse))
+            if workers > 1:
+                self.logger.info(f"Parsing sheets with {workers} worker processes")
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    frames = executor.map(parse_sheet, [path for path, _ in to_parse], [name for _, name in to_parse],
+                                          [engine] * len(to_parse))
+                    parsed = dict(zip(to_parse, frames))
+            else:
+                parsed = {(full_path, sheet_name): parse_sheet(full_path, sheet_name, engine) for full_path, sheet_name in to_parse}
+
+            if hashes:
+                for (full_path, sheet_name), df in parsed.items():
+                    self.sheet_cache.store(full_path, sheet_name, hashes[(full_path, sheet_name)], df)
+                self.sheet_cache.evict()
+
+            # sheets keep their names for a single workbook; batch mode keys them "file/sheet" and tags every row
+            self.dataframes = {}
+            for full_path, sheet_name in work:
+                df = cached[(full_path, sheet_name)] if (full_path, sheet_name) in cached else parsed[(full_path, sheet_name)]
+                if self.excel_glob:
+                    self.dataframes[f"{os.path.basename(full_path)}/{sheet_name}"] = self._tag_source(df, full_path, sheet_name)
+                else:
+                    self.dataframes[sheet_name] = df
 
             # Log information about loaded data
-            self.logger.info(f"Successfully loaded {len(self.dataframes)} sheets from {self.excel_file}")
+            self.logger.info(f"Successfully loaded {len(self.dataframes)} sheets from {len(paths)} workbooks")
             for sheet_name, df in self.dataframes.items():
-                self.logger.debug(f"Sheet '{sheet_name}': {df.shape[0]} rows, {df.shape[1]} columns")
+                self.logger.debug("Sheet '%s': %d rows, %d columns", sheet_name, df.shape[0], df.shape[1])
             
             log_step_complete("Loading Excel data")
             return self.dataframes
@@ -38,6 +134,59 @@ class CustomerSupportDataPrep:
             self.logger.error(f"Failed to load Excel data: {str(e)}", exc_info=True)
             raise
     
+    # Stream sheet rows as fixed-size DataFrame chunks aligned to the columns of every sheet
+    def iter_excel_chunks(self, chunk_size, exclude_sheets=None):
+        log_step_start("Streaming Excel data", path=self.path, excel_file=self.excel_glob or self.excel_file, chunk_size=chunk_size)
+
+        paths = self.workbook_paths()
+        workbooks = [(full_path, load_workbook(full_path, read_only=True, data_only=True)) for full_path in paths]
+        try:
+            sheets = [(full_path, ws) for full_path, workbook in workbooks
+                      for ws in workbook.worksheets if ws.title not in (exclude_sheets or [])]
+
+            # read only the header rows up front to build the merged column set
+            headers = {}
+            for full_path, ws in sheets:
+                ws.reset_dimensions()
+                headers[(full_path, ws.title)] = convert_row(next(ws.iter_rows(max_row=1, values_only=True), ()))
+            sheets = [(full_path, ws) for full_path, ws in sheets if headers[(full_path, ws.title)]]
+            all_columns = []
+            for full_path, ws in sheets:
+                header = TextParser([headers[(full_path, ws.title)]], header=0).read().columns
+                all_columns += [col for col in header if col not in all_columns]
+            self.logger.info(f"Streaming {len(sheets)} sheets from {len(paths)} workbooks with {len(all_columns)} aligned columns")
+
+            total_rows, chunk_count = 0, 0
+            for full_path, ws in sheets:
+                header = headers[(full_path, ws.title)]
+                source = (full_path, ws.title) if self.excel_glob else None
+                rows = []
+                for row in ws.iter_rows(min_row=2, values_only=True):
+                    if all(value is None for value in row):
+                        continue
+                    rows.append(convert_row(row))
+                    if len(rows) == chunk_size:
+                        yield self._build_chunk(header, rows, all_columns, source)
+                        total_rows, chunk_count, rows = total_rows + len(rows), chunk_count + 1, []
+                if rows:
+                    yield self._build_chunk(header, rows, all_columns, source)
+                    total_rows, chunk_count = total_rows + len(rows), chunk_count + 1
+                self.logger.debug(f"Sheet '{ws.title}' streamed")
+        finally:
+            for _, workbook in workbooks:
+                workbook.close()
+
+        self.logger.info(f"Streamed {total_rows} rows in {chunk_count} chunks")
+        log_step_complete("Streaming Excel data")
+
+    # Parse raw rows into a DataFrame (same NA handling and type inference as read_excel)
+    def _build_chunk(self, header, rows, all_columns, source=None):
+        width = max(len(header), max(len(row) for row in rows))
+        data = [header + [""] * (width - len(header))] + [row + [""] * (width - len(row)) for row in rows]
+        chunk = TextParser(data, header=0).read()
+        chunk = chunk.reindex(columns=all_columns)
+        return self._tag_source(chunk, *source) if source else chunk
+
     #  Merge sheets
     def merge_sheets(self, exclude_sheets=None):
         log_step_start("Merging sheets")
@@ -1,4 +1,117 @@
 from libs import *
+import sqlalchemy
+from config import CONFIG
+from logger import count_db_round_trip
+
+
+# NULL marker for COPY CSV buffers. COPY only reads an unquoted \N as NULL, and with QUOTE_NONNUMERIC the csv
+# module quotes every value except numbers, so the marker poses as a float (written through repr) and a cell
+# that really holds "\N" is quoted and stays text
+class _CopyNull(float):
+    def __repr__(self):
+        return r'\N'
+
+    __str__ = __repr__
+
+
+COPY_NULL = _CopyNull()
+
+
+# COPY ... FROM STDIN insert method for DataFrame.to_sql (called once per chunk; psycopg2 connections only)
+def copy_from_stdin(table, conn, keys, data_iter):
+    with conn.connection.cursor() as cur:
+        # write the chunk into an in-memory CSV buffer, with unquoted \N for NULLs so empty strings survive
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerows([COPY_NULL if value is None else value for value in row] for row in data_iter)
+        buffer.seek(0)
+
+        quote = conn.dialect.identifier_preparer.quote
+        target = f"{quote(table.schema)}.{quote(table.name)}" if table.schema else quote(table.name)
+        columns = ", ".join(quote(key) for key in keys)
+        count_db_round_trip()
+        cur.copy_expert(f"COPY {target} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+        return cur.rowcount
+
+
+# SQL types for categorical columns from their categories (to_sql would otherwise fall back to TEXT)
+def categorical_dtypes(df: pd.DataFrame):
+    dtype = {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            categories = df[col].cat.categories
+            if pd.api.types.is_integer_dtype(categories):
+                dtype[col] = BigInteger()
+            elif pd.api.types.is_float_dtype(categories):
+                dtype[col] = Float()
+            elif pd.api.types.is_datetime64_any_dtype(categories):
+                dtype[col] = DateTime()
+            else:
+                dtype[col] = Text()
+    return dtype
+
+
+# Write a DataFrame with to_sql using the configured bulk-load method and report throughput
+def bulk_to_sql(df: pd.DataFrame, table_name, con, logger, schema = None, if_exists = 'replace', dtype = None):
+    # categoricals are written as their values, typed like their categories
+    dtype = {**categorical_dtypes(df), **(dtype or {})} or None
+    # COPY needs psycopg2 on PostgreSQL; anything else falls back to multi-row INSERTs
+    can_copy = con.dialect.name == 'postgresql' and con.dialect.driver == 'psycopg2'
+    if CONFIG.get('bulk_load_method', 'copy') == 'copy' and can_copy:
+        load_method, method, chunksize = 'COPY', copy_from_stdin, CONFIG.get('copy_chunksize', 50000)
+    else:
+        if CONFIG.get('bulk_load_method', 'copy') == 'copy':
+            logger.warning(f"COPY not available for {table_name}, falling back to multi-row INSERT")
+        load_method, method, chunksize = 'INSERT', 'multi', 1000
+
+    start = time.perf_counter()
+    df.to_sql(table_name, con, schema=schema, if_exists=if_exists, index=False,
+              method=method, chunksize=chunksize, dtype=dtype)
+    duration = time.perf_counter() - start
+
+    rows_per_sec = len(df) / duration if duration > 0 else float(len(df))
+    logger.info(f"{load_method}: {len(df)} rows into {schema if schema else 'public'}.{table_name} "
+                f"in {duration:.2f}s ({rows_per_sec:,.0f} rows/sec)")
+
+
+# Read a table in DataFrame chunks through a server-side cursor, selecting only the given columns
+def read_sql_chunks(engine, table_name, logger, schema = None, columns = None, chunksize = None):
+    chunksize = chunksize or CONFIG.get('read_chunksize', 50000)
+    quote = engine.dialect.identifier_preparer.quote
+    target = f"{quote(schema)}.{quote(table_name)}" if schema else quote(table_name)
+    select = ", ".join(quote(col) for col in columns) if columns else "*"
+
+    # stream_results makes psycopg2 use a named cursor, so rows arrive chunk by chunk instead of all at once
+    total_rows = 0
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+        for chunk in pd.read_sql(text(f"SELECT {select} FROM {target}"), conn, chunksize=chunksize):
+            total_rows += len(chunk)
+            yield chunk
+    logger.info(f"Streamed {total_rows} rows from {schema if schema else 'public'}.{table_name} in chunks of {chunksize}")
+
+
+# Per-table data versions, so readers (materialized views) can tell whether the pipeline changed a table since they last looked
+def ensure_data_versions(conn, schema_name):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.etl_data_versions (
+            "table" VARCHAR(63) PRIMARY KEY,
+            "version" BIGINT NOT NULL,
+            "changedAt" TIMESTAMPTZ NOT NULL
+        );
+    """))
+
+
+# Record that a write changed the given tables; called in the writing transaction, and only when rows were affected
+def bump_data_version(conn, schema_name, *tables):
+    ensure_data_versions(conn, schema_name)
+    for table in tables:
+        conn.execute(text(f"""
+            INSERT INTO {schema_name}.etl_data_versions ("table", "version", "changedAt")
+            VALUES (:table, 1, now())
+            ON CONFLICT ("table") DO UPDATE
+            SET "version" = {schema_name}.etl_data_versions."version" + 1, "changedAt" = EXCLUDED."changedAt";
+        """), {"table": table})
+
 
 class DatabaseHandler:
 
@@ -16,19 +129,112 @@ class DatabaseHandler:
             f"@{creds['DB_HOST']}:{creds['DB_PORT']}/{creds['DB_NAME']}"
         )
         self.logger.info(f"Connecting to database with URI: {connect_string}")
-        return create_engine(connect_string)
+
+        # session settings every pooled connection starts with
+        connect_args = {"application_name": CONFIG.get('application_name', 'cs2025_etl')}
+        if CONFIG.get('statement_timeout_ms'):
+            connect_args["options"] = f"-c statement_timeout={CONFIG['statement_timeout_ms']}"
+
+        # SQLAlchemy 2.x renamed the VALUES page size option and dropped the plain "batch" mode
+        sqlalchemy_2 = int(sqlalchemy.__version__.split('.')[0]) >= 2
+        page_size = CONFIG.get('executemany_page_size', 1000)
+        values_page_option = 'insertmanyvalues_page_size' if sqlalchemy_2 else 'executemany_values_page_size'
+        executemany_mode = CONFIG.get('executemany_mode', 'values_plus_batch')
+        valid_modes = ['values_only', 'values_plus_batch'] + ([] if sqlalchemy_2 else ['batch'])
+        if executemany_mode not in valid_modes:
+            raise ValueError(f"Invalid CS2025_EXECUTEMANY_MODE '{executemany_mode}' for SQLAlchemy {sqlalchemy.__version__}, "
+                             f"expected one of: {', '.join(valid_modes)}")
+
+        engine = create_engine(
+            connect_string,
+            pool_size=CONFIG.get('pool_size', 5),
+            max_overflow=CONFIG.get('max_overflow', 10),
+            pool_timeout=CONFIG.get('pool_timeout', 30),
+            pool_recycle=CONFIG.get('pool_recycle', 1800),
+            pool_pre_ping=CONFIG.get('pool_pre_ping', True),
+            executemany_mode=executemany_mode,
+            executemany_batch_page_size=page_size,
+            connect_args=connect_args,
+            **{values_page_option: page_size},
+        )
+        self.logger.info(f"Engine pool: size={engine.pool.size()}, max_overflow={CONFIG.get('max_overflow', 10)}, "
+                         f"pre_ping={CONFIG.get('pool_pre_ping', True)}, recycle={CONFIG.get('pool_recycle', 1800)}s")
+
+        # count every statement so stage metrics can report database round-trips
+        event.listen(engine, 'before_cursor_execute', lambda *args: count_db_round_trip())
+        return engine
     
 # Write DataFrame to Database
-    def write_dataframe(self, df: pd.DataFrame, table_name, schema = None, if_exists = 'replace'):
+    def write_dataframe(self, df: pd.DataFrame, table_name, schema = None, if_exists = 'replace', dtype = None):
 
         try:
             self.logger.info(f"Writing DataFrame to {schema if schema else 'public'}.{table_name}")
-            df.to_sql(table_name, self.engine, schema=schema, if_exists=if_exists, index=False, method='multi', chunksize=1000)
+            bulk_to_sql(df, table_name, self.engine, self.logger, schema=schema, if_exists=if_exists, dtype=dtype)
             self.logger.info(f"Data successfully written to {schema if schema else 'public'}.{table_name}") 
         except Exception as e:
             self.logger.error(f"Error writing to database: {e}")
             raise
             
+
+# Write a stream of DataFrame chunks to one table (the first chunk replaces it)
+    def write_chunks(self, chunks, table_name, schema = None):
+        total_rows, dtype = 0, None
+        for chunk in chunks:
+            if dtype is None:
+                dtype = self._stream_dtypes(chunk)
+                if_exists = 'replace'
+            else:
+                if_exists = 'append'
+                chunk = self._match_integer_columns(chunk, dtype)
+            self.write_dataframe(chunk, table_name, schema=schema, if_exists=if_exists, dtype=dtype)
+            total_rows += len(chunk)
+
+        if dtype is None:
+            self.logger.warning(f"No rows streamed to {schema if schema else 'public'}.{table_name}")
+        self.logger.info(f"Streamed {total_rows} rows to {schema if schema else 'public'}.{table_name}")
+        return total_rows
+
+    # Column types for streamed tables, fixed from the first chunk (later chunks are converted to match)
+    def _stream_dtypes(self, chunk):
+        dtype = categorical_dtypes(chunk)
+        for col in chunk.columns:
+            if col in dtype:
+                continue
+            elif pd.api.types.is_datetime64_any_dtype(chunk[col]):
+                dtype[col] = DateTime()
+            elif pd.api.types.is_integer_dtype(chunk[col]):
+                dtype[col] = BigInteger()
+            elif pd.api.types.infer_dtype(chunk[col], skipna=True) == 'date':
+                dtype[col] = Date()
+            else:
+                dtype[col] = Text()
+        return dtype
+
+    # Integer columns of the first chunk read as floats in a chunk with blanks; write them as nullable
+    # integers so COPY sends "12", not "12.0" (a non-integral value raises here rather than in the database)
+    def _match_integer_columns(self, chunk, dtype):
+        for col, sql_type in dtype.items():
+            if isinstance(sql_type, BigInteger) and col in chunk.columns and pd.api.types.is_float_dtype(chunk[col]):
+                chunk[col] = chunk[col].astype('Int64')
+        return chunk
+
+
+# Close every pooled connection (the pipeline owns the engine and calls this once at the end)
+    def close(self):
+        self.logger.info(f"Closing database engine: {self.engine.pool.status()}")
+        self.engine.dispose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+# Read a table in chunks (server-side cursor, optional column projection)
+    def read_chunks(self, table_name, schema = None, columns = None, chunksize = None):
+        return read_sql_chunks(self.engine, table_name, self.logger, schema=schema, columns=columns, chunksize=chunksize)
+
         
 # Execute Query
     def execute_query(self, query: str):
@@ -2,8 +2,11 @@ import pandas as pd
 import numpy as np
 import os
 import re
-from sqlalchemy import create_engine, text
-from sqlalchemy.types import VARCHAR, Date, Integer
+import io
+import csv
+import time
+from sqlalchemy import create_engine, text, event
+from sqlalchemy.types import VARCHAR, Date, Integer, BigInteger, Float, DateTime, Text
 import psycopg2
 from rapidfuzz import process, fuzz
 from ulid import ULID
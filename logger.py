@@ -1,10 +1,26 @@
 import logging
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import os
+import json
+import time
+import queue
+import threading
+import atexit
+from contextlib import ContextDecorator
 from datetime import datetime
 from config import CONFIG
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 
 class ETLPLogger:
     # Singleton pattern to ensure only one logger instance
@@ -32,6 +48,13 @@ class ETLPLogger:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         log_file = os.path.join(logs_dir, f"etlp_pipeline_{timestamp}.log")
 
+        # per-stage metrics go to a JSON lines file next to the log
+        self.run_id = timestamp
+        self.metrics_file = os.path.join(logs_dir, f"etlp_metrics_{timestamp}.jsonl")
+        self.stage_metrics = []
+        self.db_round_trips = 0
+        self.event_counts = {}
+
         # get log level from config
         log_level_str = CONFIG.get('Logging_level', 'INFO').upper()
         log_level = getattr(logging, log_level_str, logging.INFO)
@@ -58,9 +81,18 @@ class ETLPLogger:
         console_handler.setLevel(log_level)
         console_handler.setFormatter(simple_formatter)
         
-        # add handlers to logger
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        # handlers run on a background listener thread, the pipeline only puts records on a queue
+        log_queue = queue.SimpleQueue()
+        self.logger.addHandler(QueueHandler(log_queue))
+        self.listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    # flush queued records and stop the listener thread
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
 
     @classmethod
     def get_logger(cls):
@@ -84,8 +116,27 @@ class ETLPLogger:
     # log DataFrame information
     def log_df_info(self, df_name, df):
         self.logger.info(f"{df_name}: Shape = {df.shape}")
-        self.logger.debug(f"Columns: {df.columns.tolist()}")
-        self.logger.debug(f"Sample:\n{df.head(3)}")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Columns: {df.columns.tolist()}")
+            self.logger.debug(f"Sample:\n{df.head(3)}")
+
+    # log a debug message built only when DEBUG is enabled (pass a callable returning the message)
+    def log_debug_lazy(self, build_msg):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(build_msg())
+
+    # count a per-row event, logging only every sample_every-th occurrence at DEBUG
+    def count_event(self, event, build_msg = None, sample_every = 1000):
+        count = self.event_counts.get(event, 0) + 1
+        self.event_counts[event] = count
+        if build_msg is not None and count % sample_every == 1 and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"{event} (#{count}, sampled 1 in {sample_every}): {build_msg()}")
+
+    # log and reset the aggregated event counts
+    def log_event_counts(self):
+        for event, count in self.event_counts.items():
+            self.logger.info(f"{event}: {count} times")
+        self.event_counts.clear()
     
     # log database operations  
     def log_db_ops(self, ops, table, rows_affected = None):
@@ -94,6 +145,35 @@ class ETLPLogger:
             msg += f" | Rows affected: {rows_affected}"
         self.logger.info(msg)
 
+    # count statements sent to the database
+    def count_db_round_trip(self, count = 1):
+        self.db_round_trips += count
+
+    # record the metrics of a finished stage and append them to the metrics file
+    def record_stage(self, metrics):
+        metrics = {'run_id': self.run_id, 'timestamp': datetime.now().isoformat(), **metrics}
+        self.stage_metrics.append(metrics)
+        with open(self.metrics_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(metrics) + "\n")
+        self.logger.debug(f"Stage metrics: {metrics}")
+
+    # log a table of every stage recorded in this run
+    def log_metrics_summary(self):
+        self.log_event_counts()
+        if not self.stage_metrics:
+            return
+        header = f"{'Stage':<32}{'Status':>8}{'Wall s':>10}{'CPU s':>10}{'Peak MB':>10}{'Rows in':>11}{'Rows out':>11}{'Rows/s':>11}{'DB trips':>10}"
+        lines = [header, "-" * len(header)]
+        for m in self.stage_metrics:
+            fmt = lambda value, spec: format(value, spec) if value is not None else "-"
+            lines.append(
+                f"{m['stage']:<32.32}{m['status']:>8}{m['wall_s']:>10.2f}{m['cpu_s']:>10.2f}"
+                f"{fmt(m['peak_rss_mb'], '.0f'):>10}{fmt(m['rows_in'], ','):>11}{fmt(m['rows_out'], ','):>11}"
+                f"{fmt(m['rows_per_s'], ',.0f'):>11}{m['db_round_trips']:>10}"
+            )
+        self.logger.info("Stage metrics summary:\n" + "\n".join(lines))
+        self.logger.info(f"Stage metrics written to {self.metrics_file}")
+
     # log errors
     def log_error(self, error_msg, exc_info = True):
         self.logger.error(f"ERROR: {error_msg}", exc_info=exc_info)
@@ -106,10 +186,104 @@ class ETLPLogger:
     
     # log debug information
     def log_debug_info(self, debug_msg, data = None):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
         self.logger.debug(f"DEBUG: {debug_msg}")
         if data is not None:
             self.logger.debug(f"Data: {data}")
 
+# Peak resident memory of this process in MB, or None when the platform can't report it
+def peak_rss_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+    return None
+
+# Resident memory of this process right now in MB, or None without psutil
+def current_rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    return None
+
+
+class RssSampler:
+    # Highest resident memory seen between start() and stop(), polled from a background thread
+    def __init__(self, interval = 0.05):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _sample(self):
+        rss = current_rss_mb()
+        self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
+
+
+class StageMetrics(ContextDecorator):
+    # Measure a pipeline stage: `with stage_metrics("clean", rows_in=n) as m: ...; m.rows_out = len(df)`,
+    # or decorate a function with @stage_metrics("clean")
+    def __init__(self, stage_name, rows_in = None, rows_out = None):
+        self.stage_name = stage_name
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+
+    def __enter__(self):
+        log_step_start(self.stage_name)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._db_start = ETLPLogger().db_round_trips
+        # the process high-water mark only says something about this stage if the stage raises it,
+        # so with psutil the stage's own peak is sampled while it runs
+        self._high_water_start = peak_rss_mb()
+        self._sampler = RssSampler().start() if psutil is not None else None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall_start
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        high_water = peak_rss_mb()
+        if self._sampler is not None:
+            peak = self._sampler.stop()
+        elif high_water is not None and self._high_water_start is not None and high_water > self._high_water_start:
+            peak = high_water
+        else:
+            # stayed under an earlier stage's peak; its own peak is unknown
+            peak = None
+        ETLPLogger().record_stage({
+            'stage': self.stage_name,
+            'status': 'ok' if exc_type is None else 'failed',
+            'wall_s': round(wall, 3),
+            'cpu_s': round(time.process_time() - self._cpu_start, 3),
+            'peak_rss_mb': round(peak, 1) if peak is not None else None,
+            'rss_high_water_mb': round(high_water, 1) if high_water is not None else None,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_s': round(rows / wall, 1) if rows is not None and wall > 0 else None,
+            'db_round_trips': ETLPLogger().db_round_trips - self._db_start,
+        })
+        if exc_type is None:
+            log_step_complete(self.stage_name, wall)
+        return False
+
+
 # Convenience Functions
 # Get the logger instance
 def get_logger():
@@ -141,4 +315,28 @@ def log_warning(warning_msg, data = None):
 
 # Log debug information
 def log_debug_info(debug_msg, data = None):
-    ETLPLogger().log_debug_info(debug_msg, data)
\ No newline at end of file
+    ETLPLogger().log_debug_info(debug_msg, data)
+
+# Measure a pipeline stage (context manager or decorator)
+def stage_metrics(stage_name, rows_in = None, rows_out = None):
+    return StageMetrics(stage_name, rows_in, rows_out)
+
+# Count statements sent to the database
+def count_db_round_trip(count = 1):
+    ETLPLogger().count_db_round_trip(count)
+
+# Log the per-stage metrics summary table
+def log_metrics_summary():
+    ETLPLogger().log_metrics_summary()
+
+# Log a debug message built only when DEBUG is enabled
+def log_debug_lazy(build_msg):
+    ETLPLogger().log_debug_lazy(build_msg)
+
+# Count a per-row event, sampling its debug message
+def count_event(event, build_msg = None, sample_every = 1000):
+    ETLPLogger().count_event(event, build_msg, sample_every)
+
+# Log and reset the aggregated event counts
+def log_event_counts():
+    ETLPLogger().log_event_counts()
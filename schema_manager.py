@@ -1,5 +1,127 @@
 from libs import *
 from logger import *
+from db_handler import bulk_to_sql, bump_data_version
+from config import CONFIG
+from customer_resolver import CustomerResolver
+
+
+# Partition of the complaints table holding one month
+def month_partition_name(month):
+    return f"complaints_{pd.Period(month, freq='M').strftime('%Y_%m')}"
+
+# Months (as periods) that a complaints DataFrame has log dates in
+def complaint_months(df: pd.DataFrame):
+    return pd.to_datetime(pd.Series(df['logDate']), errors='coerce').dropna().dt.to_period('M').unique().tolist()
+
+# Check whether a table in the schema is range partitioned
+def is_partitioned(conn, schema_name, table):
+    return conn.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relname = :table
+        )
+    """), {"schema": schema_name, "table": table}).scalar()
+
+# Create the monthly complaints partitions that don't exist yet
+def create_month_partitions(conn, schema_name, months, logger):
+    existing = set(conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = :schema AND p.relname = 'complaints'
+    """), {"schema": schema_name}).scalars().all())
+
+    created = []
+    for month in sorted({pd.Period(month, freq='M') for month in months}):
+        name = month_partition_name(month)
+        if name in existing:
+            continue
+        conn.execute(text(f"""
+            CREATE TABLE {schema_name}.{name} PARTITION OF {schema_name}.complaints
+            FOR VALUES FROM ('{month.start_time:%Y-%m-%d}') TO ('{(month + 1).start_time:%Y-%m-%d}');
+        """))
+        created.append(name)
+    if created:
+        logger.info(f"Created {len(created)} complaints partitions: {', '.join(created)}")
+    return created
+
+# Per-customer complaint totals, kept current by statement-level triggers on complaints, so reading one
+# customer's totals is a primary-key lookup instead of an aggregate over every complaint. Built in one pass
+# when missing; call it after bulk loads, since each trigger re-aggregates the customers its statement touched
+def create_customer_summary(conn, schema_name, logger):
+    exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": f"{schema_name}.customer_summary"}).scalar()
+    aggregate = f"""
+        SELECT "customerId", COUNT(*), MIN("logDate"), MAX("logDate"),
+            COUNT(*) FILTER (WHERE status IS DISTINCT FROM 'Resolved')
+        FROM {schema_name}.complaints
+    """
+    # the triggers look customers up by customerId; analytics creates the same index later if it's missing
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS idx_complaints_customerId ON {schema_name}.complaints ("customerId");'))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.customer_summary (
+            "customerId" VARCHAR(50) PRIMARY KEY REFERENCES {schema_name}.customers ("customerId") ON DELETE CASCADE,
+            "totalComplaints" BIGINT NOT NULL,
+            "firstComplaintDate" DATE,
+            "lastComplaintDate" DATE,
+            "openComplaints" BIGINT NOT NULL
+        );
+
+        CREATE OR REPLACE FUNCTION {schema_name}.refresh_customer_summary(ids TEXT[]) RETURNS void
+        LANGUAGE sql AS $$
+            DELETE FROM {schema_name}.customer_summary WHERE "customerId" = ANY(ids);
+            INSERT INTO {schema_name}.customer_summary
+            {aggregate}
+            WHERE "customerId" = ANY(ids)
+            GROUP BY "customerId";
+        $$;
+
+        CREATE OR REPLACE FUNCTION {schema_name}.maintain_customer_summary() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            ids TEXT[];
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                ids := ARRAY(SELECT DISTINCT "customerId" FROM new_rows WHERE "customerId" IS NOT NULL);
+            ELSIF TG_OP = 'DELETE' THEN
+                ids := ARRAY(SELECT DISTINCT "customerId" FROM old_rows WHERE "customerId" IS NOT NULL);
+            ELSE
+                ids := ARRAY(SELECT "customerId" FROM new_rows WHERE "customerId" IS NOT NULL
+                             UNION SELECT "customerId" FROM old_rows WHERE "customerId" IS NOT NULL);
+            END IF;
+            PERFORM {schema_name}.refresh_customer_summary(ids);
+            RETURN NULL;
+        END
+        $$;
+    """))
+
+    # a trigger with transition tables can only fire on one event, so there is one per event
+    transitions = {
+        'INSERT': 'NEW TABLE AS new_rows',
+        'UPDATE': 'OLD TABLE AS old_rows NEW TABLE AS new_rows',
+        'DELETE': 'OLD TABLE AS old_rows',
+    }
+    for event, referencing in transitions.items():
+        trigger = f"trg_customer_summary_{event.lower()}"
+        conn.execute(text(f"""
+            DROP TRIGGER IF EXISTS {trigger} ON {schema_name}.complaints;
+            CREATE TRIGGER {trigger} AFTER {event} ON {schema_name}.complaints
+            REFERENCING {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION {schema_name}.maintain_customer_summary();
+        """))
+
+    if not exists:
+        built = conn.execute(text(f"""
+            INSERT INTO {schema_name}.customer_summary
+            {aggregate}
+            WHERE "customerId" IS NOT NULL
+            GROUP BY "customerId";
+        """)).rowcount
+        logger.info(f"Built {schema_name}.customer_summary for {built} customers")
+    logger.info(f"Customer summary triggers in place on {schema_name}.complaints")
+
 
 class SchemaManager:
 
@@ -10,42 +132,164 @@ class SchemaManager:
         self.logger = logger
         self.logger.info(f"SchemaManager initialized with schema: {schema_name}")
 
+    customer_columns = ['number','name','gender','dateOfBirth','accountType','branch']
+    complaint_columns = [
+        'number','location','region','logDate','complaintSource',
+        'natureOfComplaint','subject','detailsOfComplaint',
+        'comment','updates','status','turnaroundTime','resolutionDate',
+        'reasonForReversalRequest','assign','nameOfCcRep'
+    ]
+
+    complaint_key_columns = ['number', 'logDate', 'complaintSource', 'natureOfComplaint', 'subject', 'detailsOfComplaint']
+
+    # Declared column types of the final tables, in column order. Free-form spreadsheet text is TEXT, so no
+    # overlong cell can fail a load; bounded types are kept for identifiers, normalized phones and canonicalized
+    # regions, whose lengths the pipeline itself controls
+    table_types = {
+        'customers': {
+            'customerId': 'VARCHAR(50)', 'profileId': 'VARCHAR(50)', 'name': 'TEXT',
+            'number': 'VARCHAR(20)', 'number2': 'VARCHAR(50)', 'gender': 'TEXT',
+            'dateOfBirth': 'DATE', 'accountType': 'TEXT', 'branch': 'TEXT',
+        },
+        'complaints': {
+            'customerId': 'VARCHAR(50)', 'profileId': 'VARCHAR(50)', 'number': 'VARCHAR(20)',
+            'number2': 'VARCHAR(50)', 'location': 'TEXT', 'region': 'VARCHAR(50)',
+            'complaintSource': 'TEXT', 'natureOfComplaint': 'TEXT', 'subject': 'TEXT',
+            'detailsOfComplaint': 'TEXT', 'comment': 'TEXT', 'updates': 'TEXT', 'status': 'TEXT',
+            'logDate': 'DATE', 'turnaroundTime': 'INTEGER', 'resolutionDate': 'DATE',
+            'reasonForReversalRequest': 'TEXT', 'assign': 'TEXT', 'nameOfCcRep': 'TEXT',
+            'complaintKey': 'BIGINT', 'rowHash': 'BIGINT',
+        },
+    }
+    not_null_columns = {
+        'customers': ['customerId', 'number', 'name'],
+        'complaints': ['customerId', 'number', 'logDate'],
+    }
+    table_constraints = {
+        'customers': ['CONSTRAINT customers_pkey PRIMARY KEY ("customerId")'],
+        'complaints': [
+            'CONSTRAINT fk_complaints_customer FOREIGN KEY ("customerId") REFERENCES {schema}.customers ("customerId")',
+            'CONSTRAINT ux_complaints_complaintkey UNIQUE ({complaint_key})',
+        ],
+    }
+
+    # Split rows wait here (with profileId and number2 synced) until customerIds are assigned
+    load_tables = {'customers': '_customers_load', 'complaints': '_complaints_load'}
+
+    # Stable 64-bit identity per complaint, from fields that don't change while it is being worked
+    @classmethod
+    def add_complaint_keys(cls, df: pd.DataFrame):
+        parts = pd.DataFrame(index=df.index)
+        for col in [col for col in cls.complaint_key_columns if col in df.columns]:
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                parts[col] = df[col].dt.strftime('%Y-%m-%dT%H:%M:%S')
+            else:
+                parts[col] = df[col].astype('string')
+        df['complaintKey'] = pd.util.hash_pandas_object(parts, index=False).values.view('int64')
+        return df
+
     # split customers vs complaints 
     def split_data(self, df: pd.DataFrame):
         self.logger.info("Splitting DataFrame into customers and complaints")
-        customer_columns = ['number','name','gender','dateOfBirth','accountType','branch']
-        complaint_columns = [
-            'number','location','region','logDate','complaintSource',
-            'natureOfComplaint','subject','detailsOfComplaint',
-            'comment','updates','status','turnaroundTime','resolutionDate',
-            'reasonForReversalRequest','assign','nameOfCcRep'
-        ]
-
-        customer_cols = [col for col in customer_columns if col in df.columns]
-        complaint_cols = [col for col in complaint_columns if col in df.columns]
+        customer_cols = [col for col in self.customer_columns if col in df.columns]
+        complaint_cols = [col for col in self.complaint_columns if col in df.columns]
         self.logger.info(f"Customer columns: {customer_cols}")
         self.logger.info(f"Complaint columns: {complaint_cols}")
 
-        customers_df = df[customer_cols].drop_duplicates().reset_index(drop=True)
-        complaints_df = df[complaint_cols].copy()
+        # label spelling variants of the same customer on the full rows, so each complaint keeps its own row's cluster
+        # (a phone shared by differently named people belongs to several clusters); customerIds are assigned per cluster
+        cluster_cols = []
+        if CONFIG.get('customer_resolution') and 'number' in customer_cols:
+            resolver = CustomerResolver(self.logger, threshold=CONFIG['customer_match_threshold'],
+                                        window=CONFIG['customer_match_window'])
+            df = df.assign(clusterId=resolver.resolve(df).values)
+            cluster_cols = ['clusterId']
+
+        customers_df = df[customer_cols + cluster_cols].drop_duplicates().reset_index(drop=True)
+        complaints_df = df[complaint_cols + cluster_cols + [col for col in ['rowHash'] if col in df.columns]].copy()
+
+        # one row per complaint key, keeping the latest sheet's version
+        complaints_df = self.add_complaint_keys(complaints_df)
+        duplicated = complaints_df['complaintKey'].duplicated(keep='last')
+        if duplicated.any():
+            self.logger.info(f"Dropping {duplicated.sum()} earlier versions of complaints repeated across sheets")
+            complaints_df = complaints_df[~duplicated].reset_index(drop=True)
+
+        if cluster_cols:
+            # rows with a phone first, so the row kept for each customer is one that passes the NOT NULL checks
+            customers_df = customers_df.iloc[np.argsort(customers_df['number'].isna().values, kind='stable')].reset_index(drop=True)
 
         self.logger.info(f"Split complete: customers: {len(customers_df)}, complaints: {len(complaints_df)}")
         return customers_df, complaints_df
     
+    # Normalize a phone expression in SQL the way DataCleaner does (NULL when it can't be normalized)
+    @staticmethod
+    def _normalized_phone_sql(column):
+        digits = f"regexp_replace(regexp_replace(TRIM({column}::text), '[.]0$', ''), '[^0-9]', '', 'g')"
+        return f"""CASE
+            WHEN {digits} ~ '^0[0-9]{{9}}$' THEN '+233' || substr({digits}, 2)
+            WHEN {digits} ~ '^233[0-9]{{9}}$' THEN '+' || {digits}
+            WHEN {digits} ~ '^[0-9]{{9}}$' THEN '+233' || {digits}
+        END"""
+
+    # Refresh the indexed phone -> profileId lookup from public.client, touching only changed phones
+    def refresh_phone_lookup(self):
+        lookup = f"{CONFIG.get('lookup_schema', 'client_lookup')}.client_phones"
+        with self.engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {CONFIG.get('lookup_schema', 'client_lookup')};"))
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {lookup} (
+                    "phone" VARCHAR(20) PRIMARY KEY,
+                    "profileId" VARCHAR(50) NOT NULL
+                );
+            """))
+
+            # one row per normalized phone from a single scan; phoneNumber wins over phoneNumber2
+            conn.execute(text(f"""
+                CREATE TEMP TABLE _client_phones ON COMMIT DROP AS
+                SELECT DISTINCT ON (phone) phone, "profileId"
+                FROM (
+                    SELECT {self._normalized_phone_sql('p.raw')} AS phone, cl."profileId"::varchar(50) AS "profileId", p.priority
+                    FROM public.client cl
+                    CROSS JOIN LATERAL (VALUES (cl."phoneNumber", 1), (cl."phoneNumber2", 2)) AS p(raw, priority)
+                ) phones
+                WHERE phone IS NOT NULL AND "profileId" IS NOT NULL
+                ORDER BY phone, priority, "profileId";
+            """))
+            upserted = conn.execute(text(f"""
+                INSERT INTO {lookup} AS l ("phone", "profileId")
+                SELECT phone, "profileId" FROM _client_phones
+                ON CONFLICT ("phone") DO UPDATE SET "profileId" = EXCLUDED."profileId"
+                WHERE l."profileId" IS DISTINCT FROM EXCLUDED."profileId";
+            """)).rowcount
+            removed = conn.execute(text(f"""
+                DELETE FROM {lookup} l
+                WHERE NOT EXISTS (SELECT 1 FROM _client_phones s WHERE s.phone = l."phone");
+            """)).rowcount
+
+            # keep planner statistics current so the sync joins hash against the lookup
+            if upserted or removed:
+                conn.execute(text(f"ANALYZE {lookup};"))
+
+        log_db_ops("REFRESH", lookup, upserted + removed)
+        self.logger.info(f"Phone lookup refreshed: {upserted} phones added or changed, {removed} removed")
+        return lookup
+
     # Sync profile IDs 
     def sync_profile_ids(self):
         self.logger.info("Syncing profile IDs between customers and complaints")
+        lookup = self.refresh_phone_lookup()
         with self.engine.begin() as conn:
             conn.execute(text(f"""
                 UPDATE {self.schema_name}.customers c
-                SET "profileId" = cl."profileId"
-                FROM public.client cl
-                WHERE TRIM(c."number")::varchar = ANY(ARRAY[TRIM(cl."phoneNumber"), TRIM(cl."phoneNumber2")]);
+                SET "profileId" = l."profileId"
+                FROM {lookup} l
+                WHERE TRIM(c."number") = l."phone";
 
                 UPDATE {self.schema_name}.complaints co
-                SET "profileId" = cl."profileId"
-                FROM public.client cl
-                WHERE TRIM(co."number")::varchar = ANY(ARRAY[TRIM(cl."phoneNumber"), TRIM(cl."phoneNumber2")]);
+                SET "profileId" = l."profileId"
+                FROM {lookup} l
+                WHERE TRIM(co."number") = l."phone";
             """))
         self.logger.info("Profile ID sync complete")
 
@@ -66,6 +310,236 @@ class SchemaManager:
             """))
         self.logger.info("Number2 sync complete")
 
+    # Load phone -> profileId (from the phone lookup) and profileId -> number2 (from public.client)
+    def load_client_lookups(self):
+        lookup = self.refresh_phone_lookup()
+        with self.engine.connect() as conn:
+            phones = pd.read_sql(text(f'SELECT "phone", "profileId" FROM {lookup}'), conn)
+            client = pd.read_sql(text('SELECT "profileId", "phoneNumber2" FROM public.client'), conn)
+        phone_to_profile = pd.Series(phones['profileId'].values, index=phones['phone'].values)
+
+        number2 = client.dropna(subset=['profileId']).drop_duplicates(subset=['profileId'])
+        profile_to_number2 = pd.Series(number2['phoneNumber2'].values, index=number2['profileId'].values)
+
+        self.logger.info(f"Loaded client lookups: {len(phone_to_profile)} phones, {len(profile_to_number2)} profiles")
+        return phone_to_profile, profile_to_number2
+
+    # Resolve profileId and number2 in memory (same matching as sync_client_fields)
+    def attach_client_fields(self, df: pd.DataFrame, phone_to_profile, profile_to_number2):
+        start = time.perf_counter()
+        df = df.copy()
+        df['profileId'] = df['number'].astype('string').str.strip(' ').map(phone_to_profile).astype(object)
+        df['number2'] = df['profileId'].map(profile_to_number2).astype(object)
+        matched = df['profileId'].notna().sum()
+        self.logger.info(f"Matched profileId for {matched} of {len(df)} rows ({len(df) - matched} unmatched) "
+                         f"in {time.perf_counter() - start:.2f}s")
+        return df
+
+    # Split and enrich the DataFrame without writing anything to the database
+    def prepare_tables(self, df: pd.DataFrame, split_func=None):
+        self.logger.info("Preparing customers and complaints in memory")
+        split_func = split_func or self.split_data
+        customers_df, complaints_df = split_func(df)
+
+        phone_to_profile, profile_to_number2 = self.load_client_lookups()
+        customers_df = self.attach_client_fields(customers_df, phone_to_profile, profile_to_number2)
+        complaints_df = self.attach_client_fields(complaints_df, phone_to_profile, profile_to_number2)
+        return customers_df, complaints_df
+
+    # Create the final customers and complaints tables with their declared types and constraints
+    def create_tables(self, conn):
+        # a partitioned table's unique keys must include the partition key; complaintKey already hashes logDate
+        partitioned = CONFIG.get('partition_complaints', False)
+        complaint_key = '"complaintKey", "logDate"' if partitioned else '"complaintKey"'
+        for table, types in self.table_types.items():
+            columns = [f'"{col}" {sql_type}' + (' NOT NULL' if col in self.not_null_columns[table] else '')
+                       for col, sql_type in types.items()]
+            constraints = [constraint.format(schema=self.schema_name, complaint_key=complaint_key)
+                           for constraint in self.table_constraints[table]]
+            partition_by = ' PARTITION BY RANGE ("logDate")' if partitioned and table == 'complaints' else ''
+            conn.execute(text(f"CREATE TABLE {self.schema_name}.{table} (\n    " + ",\n    ".join(columns + constraints) + f"\n){partition_by};"))
+        self.logger.info(f"Created tables {', '.join(self.table_types)} in {self.schema_name}"
+                         + (", complaints partitioned by month of logDate" if partitioned else ""))
+
+    # Recreate the schema and write final customers and complaints tables, once each
+    def write_tables(self, customers_df: pd.DataFrame, complaints_df: pd.DataFrame):
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {self.schema_name} CASCADE;"))
+            conn.execute(text(f"CREATE SCHEMA {self.schema_name};"))
+            self.logger.info(f"Schema {self.schema_name} created")
+
+            # rows go straight into the declared tables, whose constraints validate them as they load
+            self.create_tables(conn)
+            if is_partitioned(conn, self.schema_name, 'complaints'):
+                create_month_partitions(conn, self.schema_name, complaint_months(complaints_df), self.logger)
+            for table, df in (('customers', customers_df), ('complaints', complaints_df)):
+                columns = [col for col in self.table_types[table] if col in df.columns]
+                bulk_to_sql(df[columns], table, conn, self.logger, schema=self.schema_name, if_exists='append')
+            create_customer_summary(conn, self.schema_name, self.logger)
+            bump_data_version(conn, self.schema_name, 'customers', 'complaints')
+        self.logger.info(f"Schema {self.schema_name} written: customers: {len(customers_df)}, complaints: {len(complaints_df)}")
+
+    # Check the schema already holds tables an incremental load can upsert into
+    def can_upsert(self):
+        with self.engine.connect() as conn:
+            columns = conn.execute(text("""
+                SELECT table_name, column_name FROM information_schema.columns
+                WHERE table_schema = :schema AND table_name IN ('customers', 'complaints')
+            """), {"schema": self.schema_name}).fetchall()
+        columns = {(table, column) for table, column in columns}
+        return ('customers', 'customerId') in columns and ('complaints', 'complaintKey') in columns
+
+    # Check whether the complaints table is partitioned by month
+    def complaints_partitioned(self):
+        with self.engine.connect() as conn:
+            return is_partitioned(conn, self.schema_name, 'complaints')
+
+    # Apply new and changed rows (and remove deleted complaints) leaving indexes and views in place;
+    # on a partitioned table the reload_months (whose complaints are all in complaints_df) are swapped in whole
+    def upsert_tables(self, customers_df: pd.DataFrame, complaints_df: pd.DataFrame, deleted_keys=(), reload_months=()):
+        self.logger.info(f"Upserting into {self.schema_name}: customers: {len(customers_df)}, complaints: {len(complaints_df)}")
+        with self.engine.begin() as conn:
+            # builds the summary for schemas loaded before it existed; from here on the triggers keep it current
+            create_customer_summary(conn, self.schema_name, self.logger)
+            changed = {'customers': self._upsert(conn, customers_df, 'customers', 'customerId')}
+            if is_partitioned(conn, self.schema_name, 'complaints'):
+                months = pd.to_datetime(pd.Series(complaints_df['logDate']), errors='coerce').dt.to_period('M')
+                reload_months = sorted({pd.Period(month, freq='M') for month in reload_months})
+                swapped = months.isin(reload_months).values
+                changed['complaints'] = 0
+                if reload_months:
+                    # rows kept from the old partitions are the ones nothing in this load replaces or deletes
+                    replaced_keys = np.union1d(complaints_df['complaintKey'].to_numpy(dtype='int64'),
+                                               np.asarray(deleted_keys, dtype='int64'))
+                    for month in reload_months:
+                        changed['complaints'] += self._swap_month(conn, month, complaints_df[swapped & (months == month).values],
+                                                                  keep_unless=replaced_keys)
+                    # complaints swapped in whose logDate moved them out of another month leave that month here
+                    moved = conn.execute(text(f"""
+                        DELETE FROM {self.schema_name}.complaints
+                        WHERE "complaintKey" = ANY(:keys) AND date_trunc('month', "logDate")::date <> ALL(CAST(:months AS DATE[]));
+                    """), {"keys": complaints_df.loc[swapped, 'complaintKey'].astype('int64').tolist(),
+                           "months": [month.start_time.date() for month in reload_months]}).rowcount
+                    changed['complaints'] += moved
+
+                # a complaint whose logDate changed moves partition, which ON CONFLICT can't do, so replace by key
+                rest = complaints_df[~swapped]
+                create_month_partitions(conn, self.schema_name, complaint_months(rest), self.logger)
+                changed['complaints'] += self._upsert(conn, rest, 'complaints', 'complaintKey', replace=True)
+            else:
+                changed['complaints'] = self._upsert(conn, complaints_df, 'complaints', 'complaintKey')
+            if len(deleted_keys):
+                deleted = conn.execute(text(f"""
+                    DELETE FROM {self.schema_name}.complaints WHERE "complaintKey" = ANY(:keys);
+                """), {"keys": [int(key) for key in deleted_keys]}).rowcount
+                log_db_ops("DELETE", f"{self.schema_name}.complaints", deleted)
+                changed['complaints'] += deleted
+            # an upsert that touched nothing leaves the materialized views current
+            bump_data_version(conn, self.schema_name, *[table for table, rows in changed.items() if rows])
+        self.logger.info(f"Incremental load into {self.schema_name} complete")
+
+    # Stage a DataFrame next to its table and merge it with INSERT ... ON CONFLICT DO UPDATE
+    # (or, with replace, delete the rows it has keys for and insert it); returns the number of rows affected
+    def _upsert(self, conn, df: pd.DataFrame, table, key, replace=False):
+        target_columns = conn.execute(text("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = :schema AND table_name = :table
+            ORDER BY ordinal_position
+        """), {"schema": self.schema_name, "table": table}).scalars().all()
+        columns = [col for col in df.columns if col in target_columns]
+        stage = f"_stage_{table}"
+
+        # the staging table copies the target's column types so COPY converts values the same way
+        conn.execute(text(f"DROP TABLE IF EXISTS {self.schema_name}.{stage};"))
+        conn.execute(text(f"CREATE UNLOGGED TABLE {self.schema_name}.{stage} (LIKE {self.schema_name}.{table});"))
+        bulk_to_sql(df[columns], stage, conn, self.logger, schema=self.schema_name, if_exists='append')
+
+        column_list = ", ".join(f'"{col}"' for col in columns)
+        if replace:
+            replaced = conn.execute(text(f"""
+                DELETE FROM {self.schema_name}.{table} t
+                USING {self.schema_name}.{stage} s
+                WHERE t."{key}" = s."{key}";
+            """)).rowcount
+            inserted = conn.execute(text(f"""
+                INSERT INTO {self.schema_name}.{table} ({column_list})
+                SELECT {column_list} FROM {self.schema_name}.{stage};
+            """)).rowcount
+            conn.execute(text(f"DROP TABLE {self.schema_name}.{stage};"))
+
+            log_db_ops("REPLACE", f"{self.schema_name}.{table}", inserted)
+            self.logger.info(f"{table}: {inserted - replaced} new, {replaced} replaced")
+            return inserted + replaced
+
+        updates = [col for col in columns if col != key]
+        set_clause = ", ".join(f'"{col}" = EXCLUDED."{col}"' for col in updates)
+        current = ", ".join(f't."{col}"' for col in updates)
+        incoming = ", ".join(f'EXCLUDED."{col}"' for col in updates)
+        inserted = conn.execute(text(f"""
+            INSERT INTO {self.schema_name}.{table} AS t ({column_list})
+            SELECT {column_list} FROM {self.schema_name}.{stage}
+            ON CONFLICT ("{key}") DO UPDATE SET {set_clause}
+            WHERE ({current}) IS DISTINCT FROM ({incoming})
+            RETURNING (xmax = 0) AS inserted;
+        """)).scalars().all()
+        conn.execute(text(f"DROP TABLE {self.schema_name}.{stage};"))
+
+        new_rows = sum(inserted)
+        log_db_ops("UPSERT", f"{self.schema_name}.{table}", len(inserted))
+        self.logger.info(f"{table}: {new_rows} new, {len(inserted) - new_rows} changed, {len(df) - len(inserted)} unchanged")
+        return len(inserted)
+
+    # Reload one month of complaints by building its partition aside and swapping it in, instead of deleting rows
+    def swap_month_partition(self, month, complaints_df: pd.DataFrame):
+        with self.engine.begin() as conn:
+            self._swap_month(conn, month, complaints_df)
+
+    # Swap in a month partition built from complaints_df; with keep_unless, rows of the old partition whose
+    # complaintKey isn't in it are carried over (complaints this load didn't touch). Returns the rows written
+    def _swap_month(self, conn, month, complaints_df: pd.DataFrame, keep_unless=None):
+        month = pd.Period(month, freq='M')
+        name = month_partition_name(month)
+        start, end = f"{month.start_time:%Y-%m-%d}", f"{(month + 1).start_time:%Y-%m-%d}"
+        columns = [col for col in self.table_types['complaints'] if col in complaints_df.columns]
+        # the CHECK matches the partition bounds, so ATTACH doesn't have to scan the new rows
+        conn.execute(text(f"DROP TABLE IF EXISTS {self.schema_name}.{name}_new;"))
+        conn.execute(text(f"""
+            CREATE TABLE {self.schema_name}.{name}_new (LIKE {self.schema_name}.complaints INCLUDING DEFAULTS);
+            ALTER TABLE {self.schema_name}.{name}_new
+            ADD CONSTRAINT {name}_bounds CHECK ("logDate" >= DATE '{start}' AND "logDate" < DATE '{end}');
+        """))
+        bulk_to_sql(complaints_df[columns], f"{name}_new", conn, self.logger, schema=self.schema_name, if_exists='append')
+        rows = len(complaints_df)
+
+        exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": f"{self.schema_name}.{name}"}).scalar()
+        # attaching and detaching partitions fires no triggers, so the customer summary is refreshed here
+        affected = set(complaints_df['customerId'].dropna().astype(str)) if 'customerId' in complaints_df.columns else set()
+        if exists:
+            if keep_unless is not None:
+                column_list = ", ".join(f'"{col}"' for col in columns)
+                kept = conn.execute(text(f"""
+                    INSERT INTO {self.schema_name}.{name}_new ({column_list})
+                    SELECT {column_list} FROM {self.schema_name}.{name}
+                    WHERE NOT ("complaintKey" = ANY(:keys));
+                """), {"keys": [int(key) for key in keep_unless]}).rowcount
+                self.logger.info(f"Carried {kept} untouched complaints over into {name}")
+            affected.update(conn.execute(text(f'SELECT DISTINCT "customerId" FROM {self.schema_name}.{name};')).scalars().all())
+            conn.execute(text(f"ALTER TABLE {self.schema_name}.complaints DETACH PARTITION {self.schema_name}.{name};"))
+            conn.execute(text(f"DROP TABLE {self.schema_name}.{name};"))
+        conn.execute(text(f"ALTER TABLE {self.schema_name}.{name}_new RENAME TO {name};"))
+        conn.execute(text(f"""
+            ALTER TABLE {self.schema_name}.complaints ATTACH PARTITION {self.schema_name}.{name}
+            FOR VALUES FROM ('{start}') TO ('{end}');
+        """))
+        conn.execute(text(f"ALTER TABLE {self.schema_name}.{name} DROP CONSTRAINT {name}_bounds;"))
+        summary = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": f"{self.schema_name}.customer_summary"}).scalar()
+        if summary and affected:
+            conn.execute(text(f"SELECT {self.schema_name}.refresh_customer_summary(:ids);"), {"ids": sorted(affected)})
+        bump_data_version(conn, self.schema_name, 'complaints')
+        log_db_ops("SWAP", f"{self.schema_name}.{name}", rows)
+        self.logger.info(f"Swapped in partition {name} with {rows} complaints")
+        return rows
+
     # Set up the schema for the DataFrame
     def setup_schema(self, df: pd.DataFrame, split_func=None):
         self.logger.info("Setting up schema for DataFrame")
@@ -80,37 +554,118 @@ class SchemaManager:
             conn.execute(text(f"CREATE SCHEMA {self.schema_name};"))
             self.logger.info(f"Schema {self.schema_name} created")
 
-            # Write tables WITHOUT profileId and number2 columns first
-            customers_df.to_sql('customers', conn, schema=self.schema_name, 
-                            if_exists='replace', index=False)
-            self.logger.info(f"Customers table written with {len(customers_df)} rows")
-            complaints_df.to_sql('complaints', conn, schema=self.schema_name, 
-                            if_exists='replace', index=False)
-            self.logger.info(f"Complaints table written with {len(complaints_df)} rows")
+            # final tables up front; split rows go to load tables until customerIds are assigned
+            self.create_tables(conn)
+            bulk_to_sql(customers_df, self.load_tables['customers'], conn, self.logger, schema=self.schema_name,
+                        if_exists='replace')
+            self.logger.info(f"Customers load table written with {len(customers_df)} rows")
+            bulk_to_sql(complaints_df, self.load_tables['complaints'], conn, self.logger, schema=self.schema_name,
+                        if_exists='replace')
+            self.logger.info(f"Complaints load table written with {len(complaints_df)} rows")
 
             # ADD profileId and number2 columns after table creation
+            self._add_sync_columns(conn, self.load_tables.values())
+
+        # now to populate the columns
+        self._sync_from_client(self.load_tables.values())
+
+        self.logger.info(f"Schema {self.schema_name} setup complete")
+
+    # Set up the schema from a table already loaded in the database (streaming mode)
+    def setup_schema_from_table(self, source_table, source_schema='public'):
+        self.logger.info(f"Setting up schema from {source_schema}.{source_table}")
+
+        with self.engine.begin() as conn:
+            source_columns = set(conn.execute(text("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = :schema AND table_name = :table
+            """), {"schema": source_schema, "table": source_table}).scalars().all())
+            customer_cols = ", ".join(f'"{col}"' for col in self.customer_columns if col in source_columns)
+            complaint_cols = ", ".join(f'"{col}"' for col in self.complaint_columns + ['complaintKey', 'rowHash'] if col in source_columns)
+            self.logger.info(f"Customer columns: {customer_cols}")
+            self.logger.info(f"Complaint columns: {complaint_cols}")
+
+            # DROP SCHEMA WITH CASCADE
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {self.schema_name} CASCADE;"))
+            conn.execute(text(f"CREATE SCHEMA {self.schema_name};"))
+            self.logger.info(f"Schema {self.schema_name} created")
+
+            # split inside the database so rows never pass through client memory
+            self.create_tables(conn)
+            customers = conn.execute(text(f"""
+                CREATE UNLOGGED TABLE {self.schema_name}.{self.load_tables['customers']} AS
+                SELECT DISTINCT {customer_cols} FROM {source_schema}.{source_table};
+            """)).rowcount
+            self.logger.info(f"Customers load table written with {customers} rows")
+            # streamed chunks are only deduplicated within themselves, so rows repeated across chunks collapse here;
+            # for a complaint key the last streamed version wins, as it does in memory
+            if 'complaintKey' in source_columns:
+                distinct, order = 'DISTINCT ON ("complaintKey")', 'ORDER BY "complaintKey", ctid DESC'
+            else:
+                distinct, order = 'DISTINCT', ''
+            complaints = conn.execute(text(f"""
+                CREATE UNLOGGED TABLE {self.schema_name}.{self.load_tables['complaints']} AS
+                SELECT {distinct} {complaint_cols} FROM {source_schema}.{source_table} {order};
+            """)).rowcount
+            self.logger.info(f"Complaints load table written with {complaints} rows")
+
+            self._add_sync_columns(conn, self.load_tables.values())
+
+        self._sync_from_client(self.load_tables.values())
+
+        self.logger.info(f"Schema {self.schema_name} setup complete")
+
+    # Add the profileId and number2 columns populated from public.client
+    def _add_sync_columns(self, conn, tables=('customers', 'complaints')):
+        for table in tables:
             conn.execute(text(f"""
-                ALTER TABLE {self.schema_name}.customers 
+                ALTER TABLE {self.schema_name}.{table} 
                 ADD COLUMN IF NOT EXISTS "profileId" VARCHAR(50),
                 ADD COLUMN IF NOT EXISTS "number2" VARCHAR(50);
             """))
-            self.logger.info("Added profileId and number2 columns to customers table")
-            
+            self.logger.info(f"Added profileId and number2 columns to {table} table")
+
+    # Populate profileId and number2 from public.client
+    def _sync_from_client(self, tables=('customers', 'complaints')):
+        self.logger.info("Syncing profile IDs and number2 from public.client...")
+        self.sync_client_fields(tables)
+
+    # Resolve profileId and number2 together with one UPDATE per table
+    def sync_client_fields(self, tables=('customers', 'complaints')):
+        lookup = self.refresh_phone_lookup()
+        with self.engine.begin() as conn:
+            # phone -> (profileId, number2) resolved once and shared by both tables
+            start = time.perf_counter()
             conn.execute(text(f"""
-                ALTER TABLE {self.schema_name}.complaints 
-                ADD COLUMN IF NOT EXISTS "profileId" VARCHAR(50),
-                ADD COLUMN IF NOT EXISTS "number2" VARCHAR(50);
+                CREATE TEMP TABLE _client_fields ON COMMIT DROP AS
+                SELECT l."phone", l."profileId", n."phoneNumber2" AS "number2"
+                FROM {lookup} l
+                LEFT JOIN (
+                    SELECT DISTINCT ON ("profileId") "profileId"::varchar(50) AS "profileId", "phoneNumber2"
+                    FROM public.client
+                    WHERE "profileId" IS NOT NULL
+                ) n ON n."profileId" = l."profileId";
             """))
-            self.logger.info("Added profileId and number2 columns to complaints table")
+            conn.execute(text("ANALYZE _client_fields;"))
+            self.logger.info(f"Resolved client fields in {time.perf_counter() - start:.2f}s")
 
-        # now to populate the columns
-        self.logger.info("Syncing profile IDs from public.client...")
-        self.sync_profile_ids()
-        
-        self.logger.info("Syncing number2 from public.client...")
-        self.sync_number2()
-
-        self.logger.info(f"Schema {self.schema_name} setup complete")
+            for table in tables:
+                start = time.perf_counter()
+                # unchanged rows are skipped so repeat syncs don't leave dead tuples behind
+                updated = conn.execute(text(f"""
+                    UPDATE {self.schema_name}.{table} t
+                    SET "profileId" = f."profileId", "number2" = f."number2"
+                    FROM _client_fields f
+                    WHERE TRIM(t."number") = f."phone"
+                      AND (t."profileId", t."number2") IS DISTINCT FROM (f."profileId", f."number2");
+                """)).rowcount
+                matched, total = conn.execute(text(f"""
+                    SELECT count(*) FILTER (WHERE "profileId" IS NOT NULL), count(*)
+                    FROM {self.schema_name}.{table};
+                """)).one()
+                log_db_ops("UPDATE", f"{self.schema_name}.{table}", updated)
+                self.logger.info(f"{table}: {matched} matched, {total - matched} unmatched, {updated} rows updated "
+                                 f"in {time.perf_counter() - start:.2f}s")
 
     # Main function to split and sync
     def split_and_sync_data(self, df: pd.DataFrame):
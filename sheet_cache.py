@@ -0,0 +1,187 @@
+from libs import *
+import glob
+import hashlib
+import json
+import zipfile
+from xml.etree import ElementTree
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+RELS_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+SHARED_STRING_CELL = re.compile(rb'<c\b[^>]*?\bt="s"[^>]*>\s*<v>(\d+)</v>')
+SHARED_STRING_ITEM = re.compile(rb'<si\b.*?</si>', re.DOTALL)
+TYPE_TAG_SUFFIX = "__pytype"
+
+
+# Convert a DataFrame to Arrow, tagging python types of mixed object columns so they round-trip exactly
+def encode_frame(df):
+    columns, dtypes = {}, {}
+    for col in df.columns:
+        series = df[col]
+        dtypes[str(col)] = str(series.dtype)
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+            present = series.notna()
+            columns[str(col)] = pa.array(series.where(present, None).map(lambda v: None if v is None else str(v)))
+            columns[f"{col}{TYPE_TAG_SUFFIX}"] = pa.array(series.map(lambda v: type(v).__name__).where(present, None))
+        else:
+            columns[str(col)] = pa.array(series, from_pandas=True)
+
+    table = pa.table(columns)
+    return table.replace_schema_metadata({b'dtypes': json.dumps(dtypes).encode()})
+
+
+# Rebuild the original DataFrame from an Arrow table written by encode_frame
+def decode_frame(table):
+    dtypes = json.loads(table.schema.metadata[b'dtypes'])
+    df = pd.DataFrame(index=range(table.num_rows))
+    for col, dtype in dtypes.items():
+        values = table.column(col).to_pandas()
+        if f"{col}{TYPE_TAG_SUFFIX}" in table.column_names:
+            values = restore_types(values, table.column(f"{col}{TYPE_TAG_SUFFIX}").to_pandas())
+        elif dtype == 'object':
+            values = values.astype(object).where(values.notna(), np.nan)
+        else:
+            values = values.astype(dtype)
+        df[col] = values
+    return df
+
+
+# Convert tagged string values back to their original python types
+def restore_types(values, tags):
+    converters = {
+        'int': int,
+        'int64': np.int64,
+        'float': float,
+        'float64': np.float64,
+        'bool': lambda v: v == 'True',
+        'datetime': datetime.fromisoformat,
+        'Timestamp': pd.Timestamp,
+        'time': lambda v: datetime.strptime(v, '%H:%M:%S.%f' if '.' in v else '%H:%M:%S').time(),
+        'date': date.fromisoformat,
+    }
+    restored = values.astype(object).where(values.notna(), np.nan)
+    for tag in tags.dropna().unique():
+        if tag in converters:
+            mask = tags == tag
+            restored[mask] = [converters[tag](v) for v in values[mask]]
+    return restored
+
+
+class SheetCache:
+
+    # Initialize the per-sheet Arrow IPC cache (entries are only valid for the Excel engine that parsed them)
+    def __init__(self, cache_dir, max_size_mb, logger, excel_engine=None):
+        self.cache_dir = cache_dir
+        self.excel_engine = excel_engine
+        self.max_bytes = max_size_mb * 1024 * 1024
+        self.logger = logger
+        self.enabled = pa is not None
+        if not self.enabled:
+            self.logger.warning("pyarrow is not installed, sheet cache disabled")
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # Content hash of every sheet in a workbook, without parsing the cells
+    def sheet_hashes(self, full_path, sheet_names):
+        salt = f"{pd.__version__}|{self.excel_engine or 'default'}|{full_path}".encode()
+        if not zipfile.is_zipfile(full_path):
+            with open(full_path, 'rb') as f:
+                file_hash = hashlib.sha1(salt + f.read()).hexdigest()
+            return {name: file_hash for name in sheet_names}
+
+        with zipfile.ZipFile(full_path) as book:
+            parts = self._sheet_parts(book)
+            members = set(book.namelist())
+            shared = SHARED_STRING_ITEM.findall(book.read('xl/sharedStrings.xml')) if 'xl/sharedStrings.xml' in members else []
+            styles = book.getinfo('xl/styles.xml').CRC if 'xl/styles.xml' in members else 0
+
+            hashes = {}
+            for name in sheet_names:
+                digest = hashlib.sha1(salt + str(styles).encode())
+                xml = book.read(parts[name])
+                digest.update(xml)
+
+                # sheet cells only hold indexes into sharedStrings, so hash the strings they point at
+                for index in sorted({int(i) for i in SHARED_STRING_CELL.findall(xml)}):
+                    digest.update(shared[index] if index < len(shared) else b'')
+                hashes[name] = digest.hexdigest()
+        return hashes
+
+    # Map sheet names to their worksheet XML part inside the workbook archive
+    def _sheet_parts(self, book):
+        workbook = ElementTree.fromstring(book.read('xl/workbook.xml'))
+        rels = ElementTree.fromstring(book.read('xl/_rels/workbook.xml.rels'))
+        targets = {rel.get('Id'): rel.get('Target') for rel in rels}
+
+        parts = {}
+        for sheet in workbook.iter():
+            if sheet.tag.endswith('}sheet'):
+                target = targets[sheet.get(f"{RELS_NS}id")]
+                parts[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else f"xl/{target}"
+        return parts
+
+    # Cache file prefix for one sheet of one workbook
+    def _key(self, full_path, sheet_name):
+        return hashlib.sha1(f"{os.path.abspath(full_path)}\0{sheet_name}".encode()).hexdigest()[:16]
+
+    def _path(self, full_path, sheet_name, content_hash):
+        return os.path.join(self.cache_dir, f"{self._key(full_path, sheet_name)}_{content_hash}.arrow")
+
+    # Load a cached sheet through a memory map, or None on a miss
+    def load(self, full_path, sheet_name, content_hash):
+        if not self.enabled:
+            return None
+        path = self._path(full_path, sheet_name, content_hash)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            df = decode_frame(table)
+        except Exception as e:
+            self.logger.warning(f"Discarding unreadable cache entry for sheet '{sheet_name}': {e}")
+            os.remove(path)
+            return None
+
+        # touch the entry so eviction is least-recently-used
+        os.utime(path)
+        return df
+
+    # Store a parsed sheet and drop entries for older versions of it
+    def store(self, full_path, sheet_name, content_hash, df):
+        if not self.enabled:
+            return
+        path = self._path(full_path, sheet_name, content_hash)
+        try:
+            table = encode_frame(df)
+            tmp_path = f"{path}.tmp"
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.logger.warning(f"Could not cache sheet '{sheet_name}': {e}")
+            return
+
+        for stale in glob.glob(os.path.join(self.cache_dir, f"{self._key(full_path, sheet_name)}_*.arrow")):
+            if stale != path:
+                os.remove(stale)
+
+    # Evict least recently used entries until the cache fits its size limit
+    def evict(self):
+        if not self.enabled:
+            return
+        entries = sorted(glob.glob(os.path.join(self.cache_dir, "*.arrow")), key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in entries)
+        evicted = 0
+        while entries and total > self.max_bytes:
+            path = entries.pop(0)
+            total -= os.path.getsize(path)
+            os.remove(path)
+            evicted += 1
+        if evicted:
+            self.logger.info(f"Evicted {evicted} sheet cache entries ({total / 1024 / 1024:.1f} MB remaining)")
@@ -0,0 +1,157 @@
+from libs import *
+import json
+import shutil
+from logger import stage_metrics
+from sheet_cache import encode_frame, decode_frame
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+# Total rows across the named DataFrame artifacts (dicts of DataFrames count every frame), None if there are none
+def count_rows(artifacts, names):
+    frames = []
+    for name in names:
+        value = artifacts.get(name)
+        frames.extend(value.values() if isinstance(value, dict) else [value])
+    frames = [df for df in frames if isinstance(df, pd.DataFrame)]
+    return sum(len(df) for df in frames) if frames else None
+
+
+class Stage:
+
+    # A named pipeline step: reads its inputs from the artifacts, returns a dict of outputs
+    def __init__(self, name, func, inputs=(), outputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+
+class CheckpointStore:
+
+    # Parquet checkpoints for stage outputs, plus the progress of the last run
+    def __init__(self, checkpoint_dir, logger):
+        self.checkpoint_dir = checkpoint_dir
+        self.logger = logger
+        self.state_path = os.path.join(checkpoint_dir, "run_state.json")
+        self.enabled = pq is not None
+        if not self.enabled:
+            self.logger.warning("pyarrow is not installed, stage checkpoints disabled")
+            return
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+    # Save a DataFrame, or a dict of DataFrames (one file each, in order)
+    def save(self, name, value):
+        if not self.enabled:
+            return
+        if isinstance(value, pd.DataFrame):
+            self._write(value, os.path.join(self.checkpoint_dir, f"{name}.parquet"))
+        else:
+            folder = os.path.join(self.checkpoint_dir, name)
+            tmp_folder = f"{folder}.tmp"
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            os.makedirs(tmp_folder)
+            for i, df in enumerate(value.values()):
+                self._write(df, os.path.join(tmp_folder, f"{i}.parquet"))
+            with open(os.path.join(tmp_folder, "keys.json"), 'w', encoding='utf-8') as f:
+                json.dump(list(value.keys()), f, ensure_ascii=False)
+            shutil.rmtree(folder, ignore_errors=True)
+            os.replace(tmp_folder, folder)
+        self.logger.info(f"Checkpointed {name}")
+
+    # Load a checkpoint written by save
+    def load(self, name):
+        path = os.path.join(self.checkpoint_dir, f"{name}.parquet")
+        folder = os.path.join(self.checkpoint_dir, name)
+        if not self.enabled or not (os.path.exists(path) or os.path.isdir(folder)):
+            raise FileNotFoundError(f"No checkpoint for '{name}' in {self.checkpoint_dir}, run the stage that produces it first")
+
+        if os.path.exists(path):
+            value = decode_frame(pq.read_table(path))
+            self.logger.info(f"Loaded checkpoint {name}: {value.shape}")
+            return value
+        with open(os.path.join(folder, "keys.json"), encoding='utf-8') as f:
+            keys = json.load(f)
+        value = {key: decode_frame(pq.read_table(os.path.join(folder, f"{i}.parquet"))) for i, key in enumerate(keys)}
+        self.logger.info(f"Loaded checkpoint {name}: {len(value)} frames")
+        return value
+
+    def _write(self, df, path):
+        tmp_path = f"{path}.tmp"
+        pq.write_table(encode_frame(df), tmp_path)
+        os.replace(tmp_path, path)
+
+    # Stages completed by the last run, in order
+    def completed_stages(self):
+        if not os.path.exists(self.state_path):
+            return []
+        with open(self.state_path, encoding='utf-8') as f:
+            return json.load(f).get('completed', [])
+
+    def save_progress(self, completed):
+        if not self.enabled:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'completed': completed, 'updated': datetime.now().isoformat()}, f)
+        os.replace(tmp_path, self.state_path)
+
+
+class StageRunner:
+
+    # Initialize with stages in execution order
+    def __init__(self, stages, store, logger):
+        self.stages = stages
+        self.store = store
+        self.logger = logger
+        self.names = [stage.name for stage in stages]
+
+    # Run every stage, or resume/start from one, or run only one
+    def run(self, start=None, only=None, resume=False):
+        for name in (start, only):
+            if name is not None and name not in self.names:
+                raise ValueError(f"Unknown stage '{name}', expected one of: {', '.join(self.names)}")
+
+        completed = [name for name in self.store.completed_stages() if name in self.names]
+        if only is not None:
+            selected = [self.names.index(only)]
+        else:
+            if resume:
+                # first stage the last run didn't finish
+                done = 0
+                while done < len(self.names) and self.names[done] in completed:
+                    done += 1
+                if done == len(self.names):
+                    self.logger.info("Last run completed every stage, nothing to resume")
+                    return {}
+                start = self.names[done]
+            first = self.names.index(start) if start is not None else 0
+            selected = list(range(first, len(self.names)))
+            # stages after the starting point are re-run, so they no longer count as done
+            completed = [name for name in completed if self.names.index(name) < first]
+            self.store.save_progress(completed)
+
+        self.logger.info(f"Running stages: {' -> '.join(self.names[i] for i in selected)}")
+        artifacts = {}
+        for index in selected:
+            stage = self.stages[index]
+            for name in stage.inputs:
+                if name not in artifacts:
+                    artifacts[name] = self.store.load(name)
+
+            with stage_metrics(stage.name, rows_in=count_rows(artifacts, stage.inputs)) as metrics:
+                outputs = stage.func(artifacts) or {}
+                metrics.rows_out = count_rows(outputs, outputs)
+                artifacts.update(outputs)
+                for name in stage.outputs:
+                    if name in outputs:
+                        self.store.save(name, outputs[name])
+
+            if stage.name not in completed:
+                completed.append(stage.name)
+                completed.sort(key=self.names.index)
+            self.store.save_progress(completed)
+        return artifacts
@@ -5,100 +5,184 @@ from db_handler import DatabaseHandler
 from schema_manager import SchemaManager
 from data_int import DataIntegrator
 from analytics import Analytics
+from change_tracker import ChangeTracker
+from stage_runner import Stage, CheckpointStore, StageRunner
 from config import CONFIG
-from logger import get_logger, log_step_start, log_step_complete, log_df_info, log_error
+from logger import get_logger, log_step_start, log_step_complete, log_df_info, log_error, log_metrics_summary
+import argparse
 import time
 
 # Get the logger instance
 logger = get_logger()
 
-def main():
+STAGE_NAMES = ['load', 'merge', 'clean', 'tat', 'write', 'schema', 'integrate', 'analytics']
+
+# Command line options for resuming or running part of the pipeline
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Customer support ETL pipeline")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--from', dest='start', choices=STAGE_NAMES,
+                       help="start at this stage, loading its inputs from checkpoints")
+    group.add_argument('--only', choices=STAGE_NAMES, help="run only this stage")
+    group.add_argument('--resume', action='store_true', help="continue from the first stage the last run didn't finish")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    db = None
     try:
         logger.info("=" * 60)
         logger.info("CUSTOMER SUPPORT PIPELINE STARTING ... ")
         logger.info("=" * 60)
 
         total_start_time = time.time()
-        
-        # 1. LOAD AND CLEAN 
-        log_step_start("PHASE 1: Data Loading and Cleaning")
-        phase1_start = time.time()
-        
+
         prep = CustomerSupportDataPrep(CONFIG['path'], CONFIG['excel_file'], logger)
-        dfs = prep.load_excel_data()
-        logger.info(f"Loaded {len(dfs)} Excel sheets successfully.")
-        
-        merged = prep.merge_sheets(exclude_sheets=CONFIG['exclude_sheets'])
-        logger.info(f"Merged DataFrame shape: {merged.shape}")
-        
-        cleaner = DataCleaner(merged, logger)
-        df = cleaner.clean_columns()
-        df = cleaner.validate_and_calculate_tat()
-        logger.info("Data cleaned and validated successfully.")
-        
         db = DatabaseHandler(CONFIG['db_credentials'], logger)
-        db.write_dataframe(df, 'customer_support')
-        logger.info("Data written to database successfully.")
-        
-        phase1_duration = time.time() - phase1_start
-        log_step_complete("PHASE 1: Data Loading and Cleaning", phase1_duration)
-        
-        # 2. SCHEMA SETUP 
-        log_step_start("PHASE 2: Schema Setup")
-        phase2_start = time.time()
-        
         schema_mgr = SchemaManager(db.engine, CONFIG['schema'], logger)
-        schema_mgr.setup_schema(df)
-        logger.info("Schema setup completed successfully.")
-        
-        phase2_duration = time.time() - phase2_start
-        log_step_complete("PHASE 2: Schema Setup", phase2_duration)
-
-        # 3. DATA INTEGRATION 
-        log_step_start("PHASE 3: Data Integration")
-        phase3_start = time.time()
-        
         integrator = DataIntegrator(db.engine, CONFIG['schema'], logger)
-        
-        # Debug: Check if profileIds are populated before starting
-        with db.engine.connect() as conn:
-            result = conn.execute(text(f"SELECT COUNT(*) as total, COUNT(\"profileId\") as populated FROM {CONFIG['schema']}.customers WHERE \"profileId\" IS NOT NULL"))
-            stats = result.fetchone()
-            logger.debug(f"ProfileId status - Total: {stats[0]}, Populated: {stats[1]}")
-        
-        integrator.assign_customer_ids()
-        logger.info("Customer IDs assigned successfully.")
-        integrator.reorder_table_columns() 
-        logger.info("Table columns reordered successfully.")
-        integrator.apply_constraints()
-        logger.info("Constraints applied successfully.")
-        
-        phase3_duration = time.time() - phase3_start
-        log_step_complete("PHASE 3: Data Integration", phase3_duration)
-        
-        # 4. ANALYTICS
-        log_step_start("PHASE 4: Analytics")
-        phase4_start = time.time()
-        
         analytics = Analytics(db.engine, CONFIG['schema'], logger)
-        analytics.create_indexes()
-        logger.info("Indexes created successfully.")
-        analytics.create_views()
-        logger.info("Views created successfully.")
-        analytics.create_materialized_views()
-        logger.info("Materialized views created successfully.")
-        
-        phase4_duration = time.time() - phase4_start
-        log_step_complete("PHASE 4: Analytics", phase4_duration)
-        
+        tracker = ChangeTracker(db.engine, CONFIG['schema'], CONFIG['row_manifest_file'], logger)
+
+        streaming = CONFIG['streaming']
+        incremental = CONFIG['load_mode'] == 'incremental' and not streaming
+        if incremental and not schema_mgr.can_upsert():
+            logger.warning("No upsertable tables found, falling back to a full rebuild.")
+            incremental = False
+        in_memory = (CONFIG['in_memory_integration'] or incremental) and not streaming
+
+        # 1. LOAD AND CLEAN
+        def load(artifacts):
+            dfs = prep.load_excel_data(exclude_sheets=CONFIG['exclude_sheets'])
+            logger.info(f"Loaded {len(dfs)} Excel sheets successfully.")
+            return {'sheets': dfs}
+
+        def merge(artifacts):
+            prep.dataframes = artifacts['sheets']
+            merged = prep.merge_sheets(exclude_sheets=CONFIG['exclude_sheets'])
+            logger.info(f"Merged DataFrame shape: {merged.shape}")
+            return {'merged': merged}
+
+        def clean(artifacts):
+            df = DataCleaner(artifacts['merged'], logger).clean_columns()
+            logger.info("Data cleaned successfully.")
+            return {'cleaned': df}
+
+        def tat(artifacts):
+            df = DataCleaner(artifacts['cleaned'], logger).validate_and_calculate_tat()
+            logger.info("Data validated successfully.")
+            return {'validated': df}
+
+        def write(artifacts):
+            db.write_dataframe(artifacts['validated'], 'customer_support')
+            logger.info("Data written to database successfully.")
+
+        def stream(artifacts):
+            # Stream fixed-size chunks from the workbook through cleaning into the database
+            chunks = prep.iter_excel_chunks(CONFIG['stream_chunk_size'], exclude_sheets=CONFIG['exclude_sheets'])
+            cleaned = (SchemaManager.add_complaint_keys(chunk) for chunk in DataCleaner.clean_chunks(chunks, logger))
+            rows = db.write_chunks(cleaned, 'customer_support')
+            logger.info(f"Streamed {rows} cleaned rows to the database successfully.")
+
+        # 2. SCHEMA SETUP
+        def schema(artifacts):
+            if streaming:
+                schema_mgr.setup_schema_from_table('customer_support')
+                outputs = {}
+            elif in_memory:
+                # split and sync with public.client in memory; tables are written once in the integrate stage
+                customers_df, complaints_df = schema_mgr.prepare_tables(artifacts['validated'])
+                outputs = {'customers': customers_df, 'complaints': complaints_df}
+            else:
+                schema_mgr.setup_schema(artifacts['validated'])
+                outputs = {}
+            logger.info("Schema setup completed successfully.")
+            return outputs
+
+        # 3. DATA INTEGRATION
+        def integrate(artifacts):
+            if incremental:
+                # Upsert new and changed rows; existing constraints, indexes and views stay in place
+                # months mostly rewritten by this load are swapped in as whole partitions instead of row by row
+                reload_fraction = CONFIG['partition_swap_fraction'] if schema_mgr.complaints_partitioned() else None
+                customers_df, complaints_df, deleted, reload_months = tracker.changed_rows(
+                    artifacts['customers'], artifacts['complaints'], reload_fraction=reload_fraction)
+                customers_df, complaints_df = integrator.prepare_tables(customers_df, complaints_df)
+                customers_df, complaints_df = integrator.reuse_existing_ids(customers_df, complaints_df)
+                customers_df, complaints_df = integrator.apply_null_rules(customers_df, complaints_df)
+                schema_mgr.upsert_tables(customers_df, complaints_df, deleted_keys=deleted, reload_months=reload_months)
+                logger.info("Incremental load applied successfully.")
+            elif in_memory:
+                customers_df, complaints_df = integrator.prepare_tables(artifacts['customers'], artifacts['complaints'])
+                customers_df, complaints_df = integrator.apply_null_rules(customers_df, complaints_df)
+                logger.info("Customer IDs assigned and columns ordered in memory.")
+                schema_mgr.write_tables(customers_df, complaints_df)
+                logger.info("Customers and complaints written successfully.")
+            else:
+                # Debug: Check if profileIds are populated before starting
+                with db.engine.connect() as conn:
+                    result = conn.execute(text(f"SELECT COUNT(*) as total, COUNT(\"profileId\") as populated FROM {CONFIG['schema']}.{SchemaManager.load_tables['customers']} WHERE \"profileId\" IS NOT NULL"))
+                    stats = result.fetchone()
+                    logger.debug(f"ProfileId status - Total: {stats[0]}, Populated: {stats[1]}")
+
+                # fills the declared tables, whose constraints are in place from the schema stage
+                integrator.assign_customer_ids()
+                logger.info("Customer IDs assigned successfully.")
+
+            # remember this load's row hashes so the next incremental run only pushes what changed
+            if in_memory:
+                tracker.save(artifacts['complaints'])
+            else:
+                tracker.save_from_table()
+
+        # 4. ANALYTICS
+        def build_analytics(artifacts):
+            analytics.create_indexes()
+            logger.info("Indexes created successfully.")
+            # the heavy views read from materialized views, so those come first
+            analytics.create_materialized_views()
+            logger.info("Materialized views created successfully.")
+            analytics.create_views()
+            logger.info("Views created successfully.")
+            # only views over tables this run changed are refreshed, concurrently so dashboards keep reading
+            refreshed = analytics.refresh_materialized_views()
+            logger.info(f"Materialized views refreshed: {', '.join(refreshed) or 'none needed'}")
+
+        # streaming folds load -> TAT into its write stage, and keeps no DataFrames to checkpoint
+        if streaming:
+            stages = [Stage('write', stream)]
+        else:
+            stages = [
+                Stage('load', load, outputs=['sheets']),
+                Stage('merge', merge, inputs=['sheets'], outputs=['merged']),
+                Stage('clean', clean, inputs=['merged'], outputs=['cleaned']),
+                Stage('tat', tat, inputs=['cleaned'], outputs=['validated']),
+                Stage('write', write, inputs=['validated']),
+            ]
+        tables = ['customers', 'complaints'] if in_memory else []
+        stages += [
+            Stage('schema', schema, inputs=[] if streaming else ['validated'], outputs=tables),
+            Stage('integrate', integrate, inputs=tables),
+            Stage('analytics', build_analytics),
+        ]
+
+        runner = StageRunner(stages, CheckpointStore(CONFIG['checkpoint_dir'], logger), logger)
+        runner.run(start=args.start, only=args.only, resume=args.resume)
+
         total_duration = time.time() - total_start_time
         logger.info("=" * 60)
         logger.info(f"PIPELINE COMPLETED SUCCESSFULLY in {total_duration:.2f} seconds")
         logger.info("=" * 60)
-        
+
     except Exception as e:
         log_error(f"Pipeline failed: {str(e)}")
         raise
 
+    finally:
+        # the pipeline owns the one engine every stage shares
+        if db is not None:
+            db.close()
+        log_metrics_summary()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()